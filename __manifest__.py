@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Galería de Placas y Catálogo Compartido',
-    'version': '19.0.3.6.0',
+    'version': '19.0.3.10.0',
     'category': 'Sales/Sales',
     'summary': 'Selección visual de placas, carrito de reservas y catálogo público',
     'description': """
@@ -17,6 +17,7 @@
     'data': [
         'security/ir.model.access.csv',
         'data/gallery_sequence.xml',
+        'data/gallery_plate_cron.xml',
         'views/gallery_share_views.xml',
         'views/gallery_menus.xml',
         'views/gallery_public_template.xml',
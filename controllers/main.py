@@ -1,217 +1,99 @@
 # -*- coding: utf-8 -*-
 # ...
-import base64
 import json
-import re
+import os
 import logging
-from collections import defaultdict
 
 from markupsafe import Markup
+from PIL import Image, UnidentifiedImageError
+from psycopg2 import OperationalError
+from werkzeug.http import http_date
 
 from odoo import http, fields
-from odoo.http import request
+from odoo.exceptions import MissingError
+from odoo.http import Stream, request
+from odoo.addons.galeria.models.gallery_rendition import (
+    RENDITION_FORMATS,
+    RENDITION_SIZES,
+    get_rendition_path,
+    rendition_mimetype,
+    rendition_stamp,
+)
 
 _logger = logging.getLogger(__name__)
 
-# === Reglas de agrupación visual ===
-# Un bloque (lotes con mismo x_bloque) se muestra agrupado solo si:
-#   1. Tiene 5 o más placas (más de 4)
-#   2. La CATEGORÍA a la que pertenece tiene 4 o más bloques de ese tamaño
-# De lo contrario, las placas se muestran individuales (evita cards solitarios).
-THRESHOLD_BLOCK_SIZE = 5
-THRESHOLD_CATEGORY_BLOCKS = 4
+# Con ?v=<versión> la URL cambia cada vez que se vuelve a tomar la foto, así
+# que el navegador puede guardarla sin volver a preguntar.
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDATE = 'public, max-age=0, must-revalidate'
+
+
+# Placas por categoría que se pintan en el HTML; el resto se pide a
+# /gallery/api/<token>/page conforme el cliente se acerca al final.
+PUBLIC_PAGE_SIZE = 24
+PUBLIC_PAGE_MAX = 96
+
+
+def _catalog_page(items, blocks, version, offset, limit):
+    """Rebanada [offset, offset + limit) de una categoría, con el detalle de
+    los bloques que aparecen en ella y el cursor siguiente (None al final).
+
+    El cursor es "<versión del catálogo>:<posición>": la posición solo vale
+    dentro del snapshot que la generó."""
+    page = items[offset:offset + limit]
+    end = offset + limit
+    next_cursor = '%s:%d' % (version, end) if end < len(items) else None
+    page_blocks = {
+        item['id']: blocks.get(item['id'], [])
+        for item in page if item['type'] == 'block'
+    }
+    return page, page_blocks, next_cursor
+
+
+def _is_not_modified(etag, last_modified):
+    """True si el navegador ya tiene esta versión (If-None-Match manda)."""
+    httprequest = request.httprequest
+    if httprequest.if_none_match:
+        return httprequest.if_none_match.contains(etag)
+    since = httprequest.if_modified_since
+    if since and last_modified:
+        return last_modified.replace(microsecond=0) <= since.replace(tzinfo=None)
+    return False
+
+
+def _share_from_token(token):
+    """(share, expirado, ids de imagen permitidos) para un token público, sin
+    buscar en gallery_share cuando el token ya está en caché. share es vacío
+    si el token no existe."""
+    Share = request.env['gallery.share'].sudo()
+    access = Share._get_public_share_access(token)
+    if not access:
+        return Share, False, frozenset()
+    share_id, _company_id, expiration_date, image_ids = access
+    expired = bool(expiration_date and expiration_date < fields.Datetime.now())
+    return Share.browse(share_id), expired, image_ids
 
 
 class GalleryController(http.Controller):
 
     @http.route('/gallery/view/<string:token>', type='http', auth='public', csrf=False)
     def view_gallery(self, token, **kwargs):
-        share = request.env['gallery.share'].sudo().search([
-            ('access_token', '=', token)
-        ], limit=1)
+        share, expired, _image_ids = _share_from_token(token)
 
         if not share:
             return request.render('galeria.gallery_not_found', {})
 
-        if share.is_expired:
+        if expired:
             return request.render('galeria.gallery_expired', {'share': share})
 
-        StockQuant = request.env['stock.quant'].sudo().with_company(share.company_id)
-
-        # -------------------------------------------------------------
-        # 1. Recolección de items válidos (con stock real y sin holds)
-        # -------------------------------------------------------------
-        valid_items = []
-
-        for image in share.image_ids:
-            lot = image.lot_id
-            if not lot:
-                continue
-
-            quant = StockQuant.search([
-                ('lot_id', '=', lot.id),
-                ('company_id', '=', share.company_id.id),
-                ('location_id.usage', '=', 'internal'),
-                ('quantity', '>', 0),
-                ('reserved_quantity', '=', 0),
-                ('x_tiene_hold', '=', False)
-            ], limit=1)
-
-            if not quant:
-                # Reserva DÉBIL: si la placa solo está retenida por un
-                # traslado interno de carrito/escáner ABIERTO (reacomodo de
-                # ubicación), sigue vendible y debe mostrarse en la galería;
-                # esa reserva se libera sola al crear la venta.
-                candidate = StockQuant.search([
-                    ('lot_id', '=', lot.id),
-                    ('company_id', '=', share.company_id.id),
-                    ('location_id.usage', '=', 'internal'),
-                    ('quantity', '>', 0),
-                    ('reserved_quantity', '>', 0),
-                    ('x_tiene_hold', '=', False)
-                ], limit=1)
-                if candidate:
-                    weak_lines = request.env['stock.move.line'].sudo().search([
-                        ('product_id', '=', candidate.product_id.id),
-                        ('lot_id', '=', lot.id),
-                        ('location_id', '=', candidate.location_id.id),
-                        ('state', 'in', ('assigned', 'partially_available')),
-                        ('picking_id.picking_type_code', '=', 'internal'),
-                        ('picking_id.origin', '=like', 'Carrito - %'),
-                        ('picking_id.state', 'not in', ('done', 'cancel')),
-                    ])
-                    weak_reserved = sum(weak_lines.mapped('quantity'))
-                    if weak_reserved >= (candidate.reserved_quantity or 0.0):
-                        quant = candidate
-
-            if not quant:
-                continue
-
-            alto = getattr(lot, 'x_alto', 0.0) or 0.0
-            ancho = getattr(lot, 'x_ancho', 0.0) or 0.0
-            area = alto * ancho if alto and ancho else quant.quantity
-            area = round(area, 2)
-
-            categ = lot.product_id.categ_id
-            categ_name = categ.name if categ else "General"
-
-            raw_bloque = getattr(lot, 'x_bloque', None)
-            if raw_bloque and str(raw_bloque).strip() and str(raw_bloque).strip() != '0':
-                block_name = str(raw_bloque).strip()
-            else:
-                block_name = None  # placa solitaria, sin bloque
-
-            valid_items.append({
-                'image_id': image.id,
-                'quant_id': quant.id,
-                'lot_id': lot.id,
-                'lot_name': lot.name,
-                'product_id': lot.product_id.id,
-                'product_name': lot.product_id.name,
-                'categ_name': categ_name,
-                'block_name': block_name,
-                'alto': alto,
-                'ancho': ancho,
-                'area': area,
-                'dimensions': "{:.2f} x {:.2f} m".format(alto, ancho) if alto else "",
-                'url': "/gallery/image/{}/{}".format(token, image.id),
-                'write_date': str(image.write_date),
-            })
-
-        # -------------------------------------------------------------
-        # 2. Agrupar items por (categoría, bloque)
-        #    La regla aplica a nivel categoría, no producto.
-        # -------------------------------------------------------------
-        block_map = defaultdict(list)
-        loose_items = []  # placas sin bloque, van directo a individuales
-
-        for item in valid_items:
-            if item['block_name']:
-                block_map[(item['categ_name'], item['block_name'])].append(item)
-            else:
-                loose_items.append(item)
-
-        # -------------------------------------------------------------
-        # 3. Contar bloques "grandes" (>= THRESHOLD_BLOCK_SIZE) por categoría
-        # -------------------------------------------------------------
-        big_blocks_per_category = defaultdict(int)
-        for (categ_name, _block), items in block_map.items():
-            if len(items) >= THRESHOLD_BLOCK_SIZE:
-                big_blocks_per_category[categ_name] += 1
-
-        eligible_categories = {
-            cat for cat, count in big_blocks_per_category.items()
-            if count >= THRESHOLD_CATEGORY_BLOCKS
-        }
-
-        # -------------------------------------------------------------
-        # 4. Construir vista final agrupada por categoría
-        # -------------------------------------------------------------
-        final_grouped = defaultdict(list)
-        blocks_data = {}
-
-        def build_single(i):
-            return {
-                'id': i['image_id'],
-                'quant_id': i['quant_id'],
-                'lot_id': i['lot_id'],
-                'name': i['product_name'],
-                'product_name': i['product_name'],
-                'lot_name': i['lot_name'],
-                'block_name': i['block_name'] or '',
-                'dimensions': i['dimensions'],
-                'area': i['area'],
-                'url': i['url'],
-                'write_date': i['write_date'],
-                'type': 'single',
-            }
-
-        # 4a. Bloques agrupables vs expandibles
-        for (categ_name, block_name), items in block_map.items():
-            first = items[0]
-
-            should_group = (
-                categ_name in eligible_categories
-                and len(items) >= THRESHOLD_BLOCK_SIZE
-            )
-
-            if should_group:
-                total_area = round(sum(i['area'] for i in items), 2)
-                safe_block = re.sub(r'[^a-zA-Z0-9]', '_', block_name)
-                block_id = "BLK_{}_{}".format(safe_block, first['image_id'])
-
-                children = [build_single(i) for i in items]
-
-                block_item = {
-                    'id': block_id,
-                    'type': 'block',
-                    'name': "Bloque {}".format(block_name),
-                    'product_name': first['product_name'],
-                    'lot_name': "{} placas".format(len(items)),
-                    'dimensions': 'Variadas',
-                    'area': total_area,
-                    'url': first['url'],
-                    'child_ids': [c['id'] for c in children],
-                    'count': len(items),
-                    'block_name': block_name,
-                }
-                final_grouped[categ_name].append(block_item)
-                blocks_data[block_id] = children
-            else:
-                # expandir a singles
-                for i in items:
-                    final_grouped[i['categ_name']].append(build_single(i))
-
-        # 4b. Items sin bloque (sueltos)
-        for i in loose_items:
-            final_grouped[i['categ_name']].append(build_single(i))
-
-        # -------------------------------------------------------------
-        # 5. Stats globales
-        # -------------------------------------------------------------
-        total_pieces = len(valid_items)
-        total_area = round(sum(i['area'] for i in valid_items), 2)
-        categories_count = len(final_grouped)
+        # Catálogo agrupado: sale del snapshot del share mientras la
+        # disponibilidad de sus lotes no cambie.
+        catalog = share._get_public_catalog()
+        ordered_categories = dict(catalog['categories'])
+        blocks_data = catalog['blocks']
+        total_pieces = catalog['total_pieces']
+        total_area = catalog['total_area']
+        categories_count = len(ordered_categories)
 
         now = fields.Datetime.now()
         days_left = 0
@@ -219,41 +101,47 @@ class GalleryController(http.Controller):
             delta = share.expiration_date - now
             days_left = max(0, delta.days)
 
-        # Ordenar items dentro de cada categoría: bloques primero, luego singles por área desc
-        for categ in final_grouped:
-            final_grouped[categ].sort(key=lambda x: (
-                0 if x['type'] == 'block' else 1,
-                -float(x.get('area') or 0)
-            ))
-
-        # Ordenar categorías por cantidad de items desc
-        ordered_categories = dict(sorted(
-            final_grouped.items(),
-            key=lambda kv: -len(kv[1])
-        ))
-
         _logger.info(
             "[Gallery] Token=%s | Categorías=%d | Bloques=%d | Singles=%d | Total=%d placas | Elegibles=%s",
             token, categories_count, len(blocks_data),
             sum(1 for cat in ordered_categories.values() for i in cat if i['type'] == 'single'),
             total_pieces,
-            list(eligible_categories),
+            catalog['eligible_categories'],
         )
 
+        # Solo la primera pantalla de cada categoría viaja en el HTML; el
+        # JSON embebido ya no repite el catálogo, solo los bloques visibles y
+        # el cursor de cada categoría.
+        first_screen = {}
+        category_cursors = {}
+        first_blocks = {}
+        for categ, items in ordered_categories.items():
+            page, page_blocks, next_cursor = _catalog_page(
+                items, blocks_data, catalog['version'], 0, PUBLIC_PAGE_SIZE,
+            )
+            first_screen[categ] = page
+            first_blocks.update(page_blocks)
+            if next_cursor is not None:
+                category_cursors[categ] = next_cursor
+
         js_gallery_data = {
-            'initial_view': ordered_categories,
-            'blocks_details': blocks_data,
+            'blocks_details': first_blocks,
+            'category_cursors': category_cursors,
+            'page_size': PUBLIC_PAGE_SIZE,
             'token': token,
             'total_pieces': total_pieces,
             'total_area': total_area,
             'days_left': days_left,
+            'availability_version': fields.Datetime.to_string(now),
             'partner_name': (share.partner_id.name or '').title(),
             'salesperson': share.user_id.name or '',
         }
 
         values = {
             'share': share,
-            'grouped_images': ordered_categories,
+            'grouped_images': first_screen,
+            'category_totals': {categ: len(items) for categ, items in ordered_categories.items()},
+            'category_cursors': category_cursors,
             'json_data': Markup(json.dumps(js_gallery_data)),
             'company': share.company_id,
             'token': token,
@@ -264,37 +152,188 @@ class GalleryController(http.Controller):
         }
         return request.render('galeria.gallery_public_view', values)
 
-    @http.route('/gallery/image/<string:token>/<int:image_id>', type='http', auth='public')
-    def view_gallery_image(self, token, image_id, **kwargs):
-        share = request.env['gallery.share'].sudo().search([
-            ('access_token', '=', token)
-        ], limit=1)
+    @http.route('/gallery/api/<string:token>/page', type='http', auth='public', methods=['GET'])
+    def gallery_page(self, token, category='', cursor='', limit=PUBLIC_PAGE_SIZE, **kwargs):
+        """Siguiente página de una categoría del catálogo público (JSON).
+
+        Si el catálogo se recalculó desde que se emitió el cursor, la
+        posición ya no apunta al mismo item: se responde la primera página
+        del catálogo nuevo con ``restart`` y el cliente lo recorre desde ahí
+        sin repetir las tarjetas que ya tiene pintadas."""
+        share, expired, _image_ids = _share_from_token(token)
+        if not share or expired:
+            return request.make_json_response({'ok': False, 'items': []}, status=404)
+
+        version, _sep, offset = (cursor or '').rpartition(':')
+        try:
+            offset = max(0, int(offset or 0))
+            limit = min(PUBLIC_PAGE_MAX, max(1, int(limit)))
+        except (TypeError, ValueError):
+            return request.make_json_response({'ok': False, 'items': []}, status=400)
+
+        catalog = share._get_public_catalog()
+        restart = version != catalog['version']
+        if restart:
+            offset = 0
+        items = dict(catalog['categories']).get(category, [])
+        page, page_blocks, next_cursor = _catalog_page(
+            items, catalog['blocks'], catalog['version'], offset, limit,
+        )
+
+        return request.make_json_response({
+            'ok': True,
+            'category': category,
+            'items': page,
+            'blocks': page_blocks,
+            'next_cursor': next_cursor,
+            'restart': restart,
+            'total': len(items),
+        }, headers=[('Cache-Control', 'no-store')])
+
+    @http.route('/gallery/availability/<string:token>', type='http', auth='public', methods=['GET'])
+    def gallery_availability(self, token, since='', **kwargs):
+        """Lotes del catálogo que dejaron de estar (o volvieron a estar)
+        disponibles desde la versión ``since`` (JSON)."""
+        share, expired, _image_ids = _share_from_token(token)
+        if not share or expired:
+            return request.make_json_response({'ok': False}, status=404)
+
+        try:
+            since = fields.Datetime.to_datetime(since) if since else None
+        except ValueError:
+            return request.make_json_response({'ok': False}, status=400)
 
-        if not share or share.is_expired:
+        changes = share._get_public_availability_changes(since)
+        return request.make_json_response(
+            dict(changes, ok=True), headers=[('Cache-Control', 'no-store')],
+        )
+
+    @http.route([
+        '/gallery/image/<string:token>/<int:image_id>',
+        '/gallery/image/<string:token>/<int:image_id>/<string:size>',
+    ], type='http', auth='public')
+    def view_gallery_image(self, token, image_id, size='original', fmt=None, **kwargs):
+        if size not in RENDITION_SIZES:
+            return request.not_found()
+
+        share, expired, image_ids = _share_from_token(token)
+
+        # Solo las imágenes del catálogo: sin esto, con un token válido se
+        # podía recorrer cualquier stock.lot.image por id.
+        if not share or expired or image_id not in image_ids:
             return request.not_found()
 
         image = request.env['stock.lot.image'].sudo().browse(image_id)
-        if not image.exists() or not image.image:
+        if not image.exists():
             return request.not_found()
 
-        image_data = base64.b64decode(image.image)
+        # Validadores a partir de write_date + rendition: se responde 304 sin
+        # leer el binario.
+        version = rendition_stamp(image.write_date)
+        if size == 'original':
+            etag = '{}-{}-original'.format(image.id, version)
+            vary = None
+        else:
+            # Formato explícito (?fmt=webp) o negociado con el navegador:
+            # todos los navegadores actuales anuncian WebP en Accept.
+            if fmt not in RENDITION_FORMATS:
+                accept = request.httprequest.headers.get('Accept', '')
+                fmt = 'webp' if 'image/webp' in accept else 'jpeg'
+            etag = '{}-{}-{}-{}'.format(image.id, version, size, fmt)
+            vary = 'Accept'
+
+        cache_control = CACHE_IMMUTABLE if kwargs.get('v') == version else CACHE_REVALIDATE
         headers = [
-            ('Content-Type', 'image/jpeg'),
-            ('Content-Length', len(image_data)),
-            ('Cache-Control', 'public, max-age=604800'),
+            ('ETag', '"{}"'.format(etag)),
+            ('Cache-Control', cache_control),
         ]
-        return request.make_response(image_data, headers)
+        if image.write_date:
+            headers.append(('Last-Modified', http_date(image.write_date)))
+        if vary:
+            headers.append(('Vary', vary))
+
+        if _is_not_modified(etag, image.write_date):
+            return request.make_response(b'', headers, status=304)
+
+        # Sin copias en memoria: el original sale del archivo del filestore y
+        # las renditions de su archivo en disco (también bajo el filestore,
+        # así que X-Sendfile / X-Accel-Redirect sirve ambos si Odoo corre con
+        # --x-sendfile). Stream responde Range para el visor.
+        try:
+            source = request.env['ir.binary']._record_to_stream(image, 'image')
+        except MissingError:
+            return request.not_found()
+        if source.type == 'data' and not source.data:
+            return request.not_found()
+
+        stream = source
+        if size != 'original':
+            try:
+                path = get_rendition_path(
+                    request.env.cr.dbname, image.id, image.write_date, size, fmt, source.read,
+                )
+            except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+                # Foto que Pillow no abre (formato raro, archivo dañado o
+                # demasiado grande para decodificar): se sirve el original tal
+                # cual, como antes de las renditions, en vez de un error 500.
+                _logger.warning(
+                    'Galería: no se pudo generar la rendition %s/%s de la imagen %s: %s',
+                    size, fmt, image.id, exc,
+                )
+            else:
+                stream = Stream(
+                    type='path',
+                    path=path,
+                    mimetype=rendition_mimetype(fmt),
+                    size=os.path.getsize(path),
+                )
+
+        stream.conditional = True
+        stream.etag = etag
+        stream.last_modified = image.write_date
+        stream.max_age = 0
+        response = stream.get_response(
+            as_attachment=False,
+            immutable=cache_control == CACHE_IMMUTABLE,
+        )
+        if vary:
+            response.headers['Vary'] = vary
+        return response
+
+    @http.route('/gallery/cart/validate', type='jsonrpc', auth='public', csrf=False)
+    def validate_cart(self, token, items):
+        """Estado actual de cada placa del carrito, sin intentar reservar."""
+        share, expired, _image_ids = _share_from_token(token)
+
+        if not share:
+            return {'success': False, 'message': 'Token inválido.'}
+
+        if expired:
+            return {'success': False, 'message': 'El catálogo ha expirado.'}
+
+        lot_ids = []
+        for item in items or []:
+            l_id = item.get('lot_id') if isinstance(item, dict) else item
+            if l_id and str(l_id).isdigit() and int(l_id) not in lot_ids:
+                lot_ids.append(int(l_id))
+
+        status = share._get_public_cart_status(lot_ids)
+        return {
+            'success': True,
+            'items': [
+                {'lot_id': lot_id, 'status': state, 'quant_id': quant_id}
+                for lot_id, (state, quant_id) in status.items()
+            ],
+        }
 
     @http.route('/gallery/confirm_reservation', type='jsonrpc', auth='public', csrf=False)
-    def confirm_reservation(self, token, items):
-        share = request.env['gallery.share'].sudo().search([
-            ('access_token', '=', token)
-        ], limit=1)
+    def confirm_reservation(self, token, items, request_key=None):
+        share, expired, _image_ids = _share_from_token(token)
 
         if not share:
             return {'success': False, 'message': 'Token inválido.'}
 
-        if share.is_expired:
+        if expired:
             return {'success': False, 'message': 'El catálogo ha expirado.'}
 
         if not items:
@@ -316,7 +355,17 @@ class GalleryController(http.Controller):
             return {'success': False, 'message': 'Datos de items inválidos.'}
 
         try:
+            Request = request.env['gallery.reservation.request']
+            if Request._is_valid_key(request_key):
+                # Mismo intento reenviado: devuelve la reserva ya creada.
+                return Request._run_once(
+                    share, request_key, lambda: share.create_public_hold_order(clean_items),
+                )
             return share.create_public_hold_order(clean_items)
+        except OperationalError:
+            # Conflicto de concurrencia (bloqueo/serialización): se deja
+            # subir para que Odoo reintente la petición completa.
+            raise
         except Exception as e:
             _logger.exception("Gallery Reservation Error")
             return {'success': False, 'message': str(e)}
\ No newline at end of file
@@ -5,54 +5,280 @@ El navegador NUNCA habla directo con el servicio de visión: llama a Odoo y
 Odoo reenvía. Así el servicio sigue escuchando solo en la red interna y hereda
 el control de acceso del ERP — quien no tiene sesión, no busca.
 """
+import hashlib
+import io
 import json
 import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from odoo import http
+from odoo import SUPERUSER_ID, api, http
 from odoo.http import request
+from odoo.modules.registry import Registry
+from odoo.tools import SQL
 
 _logger = logging.getLogger(__name__)
 
-TIMEOUT = 60
+# (conexión, lectura). Si el servicio ni acepta la conexión se sabe en
+# segundos; la lectura sí puede tardar (inferencia CLIP), pero ya no un minuto
+# entero con el worker de Odoo bloqueado.
+TIMEOUT = (3.05, 30)
+TIMEOUT_SALUD = (2, 5)
 
 
-def _base_url():
+def _crear_sesion():
+    """Sesión HTTP compartida por el proceso: conexiones keep-alive en un pool
+    acotado y reintentos solo para fallas de conexión y 502/503/504 (las
+    búsquedas no modifican nada, repetirlas es seguro). Una lectura lenta NO
+    se reintenta: duplicaría la espera."""
+    reintentos = Retry(
+        total=2,
+        connect=2,
+        read=0,
+        status=2,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({'GET', 'POST'}),
+        raise_on_status=False,
+    )
+    adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=reintentos)
+    sesion = requests.Session()
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    return sesion
+
+
+class ServicioNoDisponible(Exception):
+    """El interruptor está abierto: no se intenta llamar al servicio."""
+
+
+class _Interruptor:
+    """Circuit breaker del servicio de visión.
+
+    Tras ``umbral`` fallas seguidas se abre y las búsquedas fallan al
+    instante durante ``espera`` segundos. Pasado ese tiempo deja pasar UNA
+    petición de prueba: si responde se cierra, si no, vuelve a abrirse.
+    """
+
+    def __init__(self, umbral=5, espera=30):
+        self.umbral = umbral
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._fallas = 0
+        self._abierto_desde = None
+        self._probando = False
+
+    def permitir(self):
+        with self._lock:
+            if self._abierto_desde is None:
+                return True
+            if self._probando or time.monotonic() - self._abierto_desde < self.espera:
+                return False
+            self._probando = True
+            return True
+
+    def exito(self):
+        with self._lock:
+            self._fallas = 0
+            self._abierto_desde = None
+            self._probando = False
+
+    def falla(self):
+        with self._lock:
+            self._fallas += 1
+            if self._probando or self._fallas >= self.umbral:
+                if self._abierto_desde is None:
+                    _logger.warning('Visión: interruptor abierto tras %s fallas', self._fallas)
+                self._abierto_desde = time.monotonic()
+            self._probando = False
+
+    def estado(self):
+        with self._lock:
+            if self._abierto_desde is None:
+                nombre = 'cerrado'
+            elif self._probando:
+                nombre = 'semiabierto'
+            else:
+                nombre = 'abierto'
+            restante = 0
+            if self._abierto_desde is not None:
+                restante = max(0, round(self.espera - (time.monotonic() - self._abierto_desde)))
+            return {'estado': nombre, 'fallas': self._fallas, 'reintento_en': restante}
+
+
+ERROR_NO_DISPONIBLE = 'El servicio de búsqueda visual no responde; intenta de nuevo en unos segundos'
+
+ERROR_OCUPADO = 'Hay demasiadas búsquedas por foto en curso; intenta de nuevo en unos segundos'
+
+_SESION = _crear_sesion()
+_INTERRUPTOR = _Interruptor()
+
+
+class _CacheTTL:
+    """Caché LRU con caducidad, compartida por los hilos del proceso."""
+
+    def __init__(self, maximo=256, ttl=600):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def get(self, llave):
+        with self._lock:
+            entrada = self._datos.get(llave)
+            if entrada is None or time.monotonic() - entrada[0] > self.ttl:
+                self._datos.pop(llave, None)
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(llave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def put(self, llave, valor):
+        with self._lock:
+            self._datos[llave] = (time.monotonic(), valor)
+            self._datos.move_to_end(llave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._datos),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / total, 3) if total else 0.0,
+            }
+
+
+# Los vendedores repiten las mismas búsquedas ("mármol blanco",
+# "travertino"): se guardan los resultados CRUDOS del servicio (solo ids y
+# parecido) y _enriquecer se aplica en cada respuesta con datos vigentes.
+_CACHE_TEXTO = _CacheTTL(maximo=256, ttl=600)
+
+# Búsqueda por foto, por huella SHA-256 de los bytes subidos: la foto ya
+# normalizada (pocas, pesan cientos de KB) y la última respuesta por límite.
+_CACHE_FOTO = _CacheTTL(maximo=16, ttl=900)
+_CACHE_IMAGEN = _CacheTTL(maximo=64, ttl=600)
+
+FOTO_LADO_MAXIMO = 1600
+
+# Resultados crudos que se piden al servicio por búsqueda. Las páginas
+# siguientes ("Ver más") salen de esta ventana en caché, sin volver a
+# calcular el embedding ni subir otra vez la foto.
+VENTANA = 240
+
+# Versión del índice según /salud, consultada como mucho cada 30 s.
+SALUD_TTL = 30
+_salud = {'momento': 0.0, 'llave': None, 'version': None}
+_salud_lock = threading.Lock()
+
+
+def _base_url(env=None):
     """URL del servicio de visión. Configurable por parámetro del sistema."""
-    return request.env['ir.config_parameter'].sudo().get_param(
+    env = env if env is not None else request.env
+    return env['ir.config_parameter'].sudo().get_param(
         'som_vision.url', 'http://som-vision-api:8000'
     )
 
 
-def _enriquecer(resultados):
+def _llamar(metodo, ruta, timeout=TIMEOUT, base_url=None, **kwargs):
+    """Petición al servicio de visión a través del pool y el interruptor.
+
+    Cuentan como falla del servicio los errores de red, los timeouts y las
+    respuestas 5xx; un 4xx (imagen no legible) es culpa de la petición.
+    Cualquier otra excepción también cuenta como falla: si la petición de
+    prueba del interruptor semiabierto termina sin éxito ni falla, el
+    interruptor se quedaría rechazando todo.
+    """
+    if not _INTERRUPTOR.permitir():
+        raise ServicioNoDisponible()
+    try:
+        url = '%s%s' % (base_url or _base_url(), ruta)
+        r = _SESION.request(metodo, url, timeout=timeout, **kwargs)
+    except Exception:
+        _INTERRUPTOR.falla()
+        raise
+    if r.status_code >= 500:
+        _INTERRUPTOR.falla()
+    else:
+        _INTERRUPTOR.exito()
+    return r
+
+
+def _enriquecer(resultados, env=None, mejor=None):
     """Añade a cada resultado lo que hace falta para pintarlo.
 
     El servicio de visión solo conoce ids de adjunto; los datos del lote y la
-    URL de la imagen salen de Odoo.
+    URL de la imagen salen de Odoo. Número fijo de consultas sin importar
+    cuántos resultados lleguen: una consulta une adjunto → foto → lote, los
+    nombres de producto se calculan juntos y la existencia sale de un solo
+    agrupado de quants.
     """
     if not resultados:
         return []
 
-    att_ids = [r['attachment_id'] for r in resultados]
-    adjuntos = request.env['ir.attachment'].sudo().browse(att_ids)
-    # attachment_id -> id del registro stock.lot.image que lo contiene
-    res_por_att = {a.id: a.res_id for a in adjuntos if a.exists()}
+    env = env if env is not None else request.env
+    att_ids = tuple({r['attachment_id'] for r in resultados})
+    env.cr.execute(SQL(
+        """
+        SELECT a.id, img.id, lot.id, lot.name, lot.product_id
+          FROM ir_attachment a
+          JOIN stock_lot_image img ON img.id = a.res_id
+          LEFT JOIN stock_lot lot ON lot.id = img.lot_id
+         WHERE a.id IN %s
+           AND a.res_model = 'stock.lot.image'
+        """,
+        att_ids,
+    ))
+    # attachment_id -> (id de stock.lot.image, lot_id, nombre del lote, product_id)
+    por_att = {fila[0]: fila[1:] for fila in env.cr.fetchall()}
+
+    product_ids = {fila[3] for fila in por_att.values() if fila[3]}
+    productos = env['product.product'].sudo().browse(product_ids)
+    # display_name se calcula para todo el recordset de una vez.
+    nombre_producto = dict(zip(productos.ids, productos.mapped('display_name')))
 
-    lot_ids = [r['lot_id'] for r in resultados if r.get('lot_id')]
-    lotes = request.env['stock.lot'].sudo().browse(lot_ids)
-    lote_por_id = {l.id: l for l in lotes if l.exists()}
+    lot_ids = {fila[1] for fila in por_att.values() if fila[1]}
+    lot_ids |= {r['lot_id'] for r in resultados if r.get('lot_id')}
+    # Disponible = mismo criterio que el selector: existencia interna libre,
+    # sin reservas ni hold.
+    disponibles = set()
+    if lot_ids:
+        grupos = env['stock.quant'].sudo()._read_group([
+            ('lot_id', 'in', list(lot_ids)),
+            ('company_id', 'in', env.companies.ids),
+            ('location_id.usage', '=', 'internal'),
+            ('quantity', '>', 0),
+            ('reserved_quantity', '=', 0),
+            ('x_tiene_hold', '=', False),
+        ], ['lot_id'])
+        disponibles = {lote.id for (lote,) in grupos}
 
-    mejor = max((r.get('parecido') or 0) for r in resultados) or 1
+    # Con páginas, el "mejor" es el de la búsqueda completa, no el de la
+    # página: si no, el primer resultado de cada página marcaría 100%.
+    mejor = mejor or max((r.get('parecido') or 0) for r in resultados) or 1
 
     salida = []
     for r in resultados:
-        lote = lote_por_id.get(r.get('lot_id'))
-        img_id = res_por_att.get(r['attachment_id'])
+        img_id, lot_id, lot_name, product_id = por_att.get(r['attachment_id'], (None,) * 4)
+        lot_id = lot_id or r.get('lot_id')
         salida.append({
-            'lot_id': r.get('lot_id'),
-            'lot_name': r.get('lot_name') or (lote.name if lote else ''),
-            'producto': lote.product_id.display_name if lote and lote.product_id else '',
+            'lot_id': lot_id,
+            'attachment_id': r['attachment_id'],
+            'lot_name': r.get('lot_name') or lot_name or '',
+            'producto': nombre_producto.get(product_id, ''),
+            'disponible': lot_id in disponibles,
             # Miniatura para la retícula e imagen completa para el visor:
             # 24 fotos a tamaño real serían decenas de MB por búsqueda.
             'imagen_url': '/web/image/stock.lot.image/%s/image_small' % img_id if img_id else '',
@@ -65,6 +291,233 @@ def _enriquecer(resultados):
     return salida
 
 
+def _pagina(resultados, offset, limite, env=None):
+    """Respuesta de una página de la ventana de resultados crudos.
+
+    ``siguiente`` es el cursor de la página siguiente (None al final).
+    """
+    offset = max(0, int(offset or 0))
+    limite = max(1, min(int(limite or 24), VENTANA))
+    pagina = resultados[offset:offset + limite]
+    siguiente = offset + limite if offset + limite < len(resultados) else None
+    mejor = max((r.get('parecido') or 0) for r in resultados) if resultados else None
+    return {
+        'ok': True,
+        'resultados': _enriquecer(pagina, env=env, mejor=mejor),
+        'siguiente': siguiente,
+        'total': len(resultados),
+    }
+
+
+def _normalizar_consulta(q):
+    """Misma búsqueda escrita distinto -> misma llave de caché."""
+    return ' '.join(unicodedata.normalize('NFKC', q).lower().split())
+
+
+def _registrar_salud(datos, base_url):
+    """Guarda la versión del índice que reporta /salud. Cualquier foto nueva
+    indexada cambia la versión y deja fuera las búsquedas en caché."""
+    version = datos.get('version_indice', datos.get('fotos_indexadas'))
+    with _salud_lock:
+        _salud.update(momento=time.monotonic(), llave=base_url, version=version)
+    return version
+
+
+def _version_indice(base_url):
+    """Versión del índice vigente (None si el servicio no la reporta)."""
+    with _salud_lock:
+        if _salud['llave'] == base_url and time.monotonic() - _salud['momento'] < SALUD_TTL:
+            return _salud['version']
+    try:
+        r = _llamar('GET', '/salud', timeout=TIMEOUT_SALUD, base_url=base_url)
+        r.raise_for_status()
+        return _registrar_salud(r.json(), base_url)
+    except Exception as exc:  # noqa: BLE001
+        _logger.info('Visión: sin versión de índice (%s)', str(exc) or 'interruptor abierto')
+        return None
+
+
+def _normalizar_foto(contenido, nombre_original, tipo_original):
+    """(nombre, bytes, tipo) a reenviar al servicio de visión.
+
+    NORMALIZACIÓN A JPEG antes de reenviar: el navegador puede mandar
+    WEBP, HEIC, PNG con alfa o CMYK y el servicio de visión respondía
+    400 'imagen no legible'. Transcodificando aquí, el servicio recibe
+    siempre lo mismo. OJO Odoo 19 anula Image.init() dentro del
+    worker: los plugins de Pillow se importan EXPLÍCITOS o el open()
+    truena con UnidentifiedImageError aunque la librería los tenga.
+    """
+    try:
+        from PIL import Image
+        import PIL.JpegImagePlugin   # noqa: F401
+        import PIL.PngImagePlugin    # noqa: F401
+        import PIL.WebPImagePlugin   # noqa: F401
+        import PIL.GifImagePlugin    # noqa: F401
+        import PIL.BmpImagePlugin    # noqa: F401
+        import PIL.TiffImagePlugin   # noqa: F401
+
+        img = Image.open(io.BytesIO(contenido))
+        if img.format == 'JPEG':
+            # Foto de cámara: el decodificador JPEG reduce 1/2, 1/4 o 1/8 al
+            # leer, sin descomprimir los 12+ megapíxeles completos.
+            img.draft('RGB', (FOTO_LADO_MAXIMO, FOTO_LADO_MAXIMO))
+        img = img.convert('RGB')
+        # Tope de tamaño: para similitud no se necesita más, y recorta
+        # el payload al servicio (nginx ya bufferea a disco los grandes).
+        img.thumbnail((FOTO_LADO_MAXIMO, FOTO_LADO_MAXIMO))
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=92)
+        return 'consulta.jpg', buf.getvalue(), 'image/jpeg'
+    except Exception as exc:  # noqa: BLE001
+        # El Pillow de Odoo no trae AVIF ni HEIC, y HEIC es el formato por
+        # omisión de las fotos de iPhone. Que Odoo no sepa leerlo NO es
+        # motivo para rechazar al usuario: el servicio de visión reconoce
+        # 75 formatos, así que se le manda el original y decide él. La
+        # transcodificación queda como optimización, no como requisito.
+        _logger.info(
+            'Sin transcodificar (%s, %s bytes): %s. Se envía el original.',
+            tipo_original, len(contenido), exc)
+        return (nombre_original or 'consulta.img', contenido,
+                tipo_original or 'application/octet-stream')
+
+
+def _buscar_por_foto(dbname, base_url, contenido, nombre_archivo, tipo_archivo):
+    """Ventana de resultados CRUDOS de la búsqueda por foto (sin enriquecer).
+
+    No usa ``request``: corre igual en el worker HTTP que en el pool de
+    búsquedas asíncronas.
+    """
+    huella = hashlib.sha256(contenido).hexdigest()
+
+    # Misma foto otra vez (otra página, reintento tras un timeout):
+    # con la misma versión del índice la respuesta es la misma.
+    version = _version_indice(base_url)
+    llave = None
+    if version is not None:
+        llave = (dbname, base_url, version, 'imagen', huella)
+        resultados = _CACHE_IMAGEN.get(llave)
+        if resultados is not None:
+            return resultados
+
+    # Y aunque la ventana haya caducado, no se vuelve a transcodificar.
+    foto = _CACHE_FOTO.get(huella)
+    if foto is None:
+        foto = _normalizar_foto(contenido, nombre_archivo, tipo_archivo)
+        _CACHE_FOTO.put(huella, foto)
+    nombre, contenido, tipo = foto
+
+    r = _llamar(
+        'POST', '/buscar',
+        params={'limite': VENTANA},
+        files={'foto': (nombre, contenido, tipo)},
+        base_url=base_url,
+    )
+    if r.status_code >= 400:
+        # El detalle del servicio va al log: sin esto el 400 era
+        # ciego y no se sabía QUÉ rechazó.
+        _logger.warning(
+            'Visión respondió %s en /buscar: %s',
+            r.status_code, (r.text or '')[:500])
+    r.raise_for_status()
+    resultados = r.json().get('resultados', [])
+    if llave is not None:
+        _CACHE_IMAGEN.put(llave, resultados)
+    return resultados
+
+
+def _mensaje_error(exc):
+    """Mensaje para el usuario a partir de la falla de una búsqueda por foto."""
+    if isinstance(exc, ServicioNoDisponible):
+        return ERROR_NO_DISPONIBLE
+    if isinstance(exc, requests.HTTPError):
+        # El servicio explica el motivo (formato no admitido, etc.);
+        # mostrarlo es más útil que un genérico.
+        detalle = ''
+        try:
+            detalle = (exc.response.json() or {}).get('detail', '')
+        except Exception:  # noqa: BLE001
+            pass
+        _logger.warning('Búsqueda por imagen falló: %s | %s', exc, detalle)
+        return detalle or 'No se pudo procesar la imagen'
+    _logger.warning('Búsqueda por imagen falló: %s', exc)
+    return 'No se pudo procesar la imagen'
+
+
+# ── Búsquedas por foto asíncronas ──
+# Un pool acotado POR BASE DE DATOS Y POR PROCESO: una base ocupada no frena
+# a otra y con la cola llena se rechaza en vez de acumular. El límite es por
+# proceso: con N workers el servicio de visión puede recibir hasta
+# N × TRABAJOS_SIMULTANEOS inferencias a la vez, y cada worker tiene su propia
+# cola de TRABAJOS_EN_COLA. Los hilos mueren con su worker; los trabajos que
+# deja a medias los cierra som.vision.job (ver _fail_stale).
+TRABAJOS_SIMULTANEOS = 2
+TRABAJOS_EN_COLA = 20
+
+_pools = {}
+_en_cola = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(dbname):
+    with _pools_lock:
+        pool = _pools.get(dbname)
+        if pool is None:
+            pool = _pools[dbname] = ThreadPoolExecutor(
+                max_workers=TRABAJOS_SIMULTANEOS,
+                thread_name_prefix='som_vision_%s' % dbname,
+            )
+        return pool
+
+
+def _encolar_trabajo(env, contenido, nombre_archivo, tipo_archivo, limite):
+    """Registra el trabajo (en su propia transacción, para que el hilo lo vea
+    de inmediato) y lo manda al pool. Devuelve su id, o None si la cola de
+    esta base de datos está llena."""
+    dbname = env.cr.dbname
+    with _pools_lock:
+        if _en_cola.get(dbname, 0) >= TRABAJOS_EN_COLA:
+            return None
+        _en_cola[dbname] = _en_cola.get(dbname, 0) + 1
+
+    try:
+        base_url = _base_url(env)
+        with Registry(dbname).cursor() as cr:
+            trabajo = api.Environment(cr, env.uid, {})['som.vision.job'].sudo().create({
+                'user_id': env.uid,
+                'limite': limite,
+            })
+            trabajo_id = trabajo.id
+        _pool(dbname).submit(
+            _ejecutar_trabajo, dbname, trabajo_id, base_url,
+            contenido, nombre_archivo, tipo_archivo,
+        )
+    except Exception:
+        with _pools_lock:
+            _en_cola[dbname] -= 1
+        raise
+    return trabajo_id
+
+
+def _ejecutar_trabajo(dbname, trabajo_id, base_url, contenido, nombre_archivo, tipo_archivo):
+    """Cuerpo del hilo: busca y deja el resultado crudo en el trabajo."""
+    threading.current_thread().dbname = dbname
+    try:
+        valores = {'state': 'listo'}
+        try:
+            valores['resultados'] = _buscar_por_foto(
+                dbname, base_url, contenido, nombre_archivo, tipo_archivo,
+            )
+        except Exception as exc:  # noqa: BLE001
+            valores = {'state': 'error', 'error': _mensaje_error(exc)}
+        with Registry(dbname).cursor() as cr:
+            api.Environment(cr, SUPERUSER_ID, {})['som.vision.job'].browse(trabajo_id).write(valores)
+    except Exception:  # noqa: BLE001
+        _logger.exception('Visión: el trabajo %s no pudo guardarse', trabajo_id)
+    finally:
+        with _pools_lock:
+            _en_cola[dbname] -= 1
+
+
 class SomVisionController(http.Controller):
 
     # Odoo 19: type='jsonrpc'. El antiguo type='json' sigue funcionando como
@@ -73,26 +526,53 @@ class SomVisionController(http.Controller):
     @http.route('/som_vision/estado', type='jsonrpc', auth='user')
     def estado(self):
         try:
-            r = requests.get('%s/salud' % _base_url(), timeout=10)
+            r = _llamar('GET', '/salud', timeout=TIMEOUT_SALUD)
             r.raise_for_status()
-            return {'ok': True, **r.json()}
+            datos = r.json()
+            _registrar_salud(datos, _base_url())
+            return {
+                'ok': True,
+                **datos,
+                'interruptor': _INTERRUPTOR.estado(),
+                'cache_texto': _CACHE_TEXTO.estadisticas(),
+                'cache_imagen': _CACHE_IMAGEN.estadisticas(),
+            }
         except Exception as exc:  # noqa: BLE001
-            _logger.warning('Visión no disponible: %s', exc)
-            return {'ok': False, 'error': 'El servicio de búsqueda visual no responde'}
+            _logger.warning('Visión no disponible: %s', str(exc) or 'interruptor abierto')
+            return {
+                'ok': False,
+                'error': 'El servicio de búsqueda visual no responde',
+                'interruptor': _INTERRUPTOR.estado(),
+                'cache_texto': _CACHE_TEXTO.estadisticas(),
+                'cache_imagen': _CACHE_IMAGEN.estadisticas(),
+            }
 
     @http.route('/som_vision/buscar_texto', type='jsonrpc', auth='user')
-    def buscar_texto(self, q='', limite=24):
+    def buscar_texto(self, q='', limite=24, offset=0):
         q = (q or '').strip()
         if len(q) < 2:
             return {'ok': False, 'error': 'Escribe al menos dos letras'}
         try:
-            r = requests.post(
-                '%s/buscar-texto' % _base_url(),
-                params={'q': q, 'limite': int(limite)},
-                timeout=TIMEOUT,
-            )
+            base_url = _base_url()
+            version = _version_indice(base_url)
+            # Sin versión de índice no se sabe si la caché sigue vigente.
+            llave = None
+            if version is not None:
+                llave = (request.env.cr.dbname, base_url, version,
+                         _normalizar_consulta(q))
+                resultados = _CACHE_TEXTO.get(llave)
+                if resultados is not None:
+                    return _pagina(resultados, offset, limite)
+
+            r = _llamar('POST', '/buscar-texto', params={'q': q, 'limite': VENTANA},
+                        base_url=base_url)
             r.raise_for_status()
-            return {'ok': True, 'resultados': _enriquecer(r.json().get('resultados', []))}
+            resultados = r.json().get('resultados', [])
+            if llave is not None:
+                _CACHE_TEXTO.put(llave, resultados)
+            return _pagina(resultados, offset, limite)
+        except ServicioNoDisponible:
+            return {'ok': False, 'error': ERROR_NO_DISPONIBLE}
         except Exception as exc:  # noqa: BLE001
             _logger.warning('Búsqueda por texto falló: %s', exc)
             return {'ok': False, 'error': 'No se pudo completar la búsqueda'}
@@ -111,74 +591,93 @@ class SomVisionController(http.Controller):
                 {'ok': False, 'error': 'La imagen llegó vacía'}
             )
 
-        # NORMALIZACIÓN A JPEG antes de reenviar: el navegador puede mandar
-        # WEBP, HEIC, PNG con alfa o CMYK y el servicio de visión respondía
-        # 400 'imagen no legible'. Transcodificando aquí, el servicio recibe
-        # siempre lo mismo. OJO Odoo 19 anula Image.init() dentro del
-        # worker: los plugins de Pillow se importan EXPLÍCITOS o el open()
-        # truena con UnidentifiedImageError aunque la librería los tenga.
         try:
-            import io
-            from PIL import Image
-            import PIL.JpegImagePlugin   # noqa: F401
-            import PIL.PngImagePlugin    # noqa: F401
-            import PIL.WebPImagePlugin   # noqa: F401
-            import PIL.GifImagePlugin    # noqa: F401
-            import PIL.BmpImagePlugin    # noqa: F401
-            import PIL.TiffImagePlugin   # noqa: F401
-
-            img = Image.open(io.BytesIO(contenido))
-            img = img.convert('RGB')
-            # Tope de tamaño: para similitud no se necesita más, y recorta
-            # el payload al servicio (nginx ya bufferea a disco los grandes).
-            img.thumbnail((1600, 1600))
-            buf = io.BytesIO()
-            img.save(buf, format='JPEG', quality=92)
-            contenido = buf.getvalue()
-            nombre, tipo = 'consulta.jpg', 'image/jpeg'
-        except Exception as exc:  # noqa: BLE001
-            # El Pillow de Odoo no trae AVIF ni HEIC, y HEIC es el formato por
-            # omisión de las fotos de iPhone. Que Odoo no sepa leerlo NO es
-            # motivo para rechazar al usuario: el servicio de visión reconoce
-            # 75 formatos, así que se le manda el original y decide él. La
-            # transcodificación queda como optimización, no como requisito.
-            _logger.info(
-                'Sin transcodificar (%s, %s bytes): %s. Se envía el original.',
-                archivo.mimetype, len(contenido), exc)
-            nombre = archivo.filename or 'consulta.img'
-            tipo = archivo.mimetype or 'application/octet-stream'
+            limite = int(kw.get('limite') or 24)
+        except (TypeError, ValueError):
+            limite = 24
+
+        if kw.get('asincrono'):
+            # El worker HTTP queda libre de inmediato: la transcodificación y
+            # la inferencia corren en el pool de la base de datos y el
+            # navegador pregunta por el resultado.
+            trabajo_id = _encolar_trabajo(
+                request.env, contenido, archivo.filename, archivo.mimetype, limite,
+            )
+            if not trabajo_id:
+                return request.make_json_response({'ok': False, 'error': ERROR_OCUPADO})
+            return request.make_json_response({'ok': True, 'trabajo': trabajo_id})
 
         try:
-            limite = int(kw.get('limite') or 24)
-            r = requests.post(
-                '%s/buscar' % _base_url(),
-                params={'limite': limite},
-                files={'foto': (nombre, contenido, tipo)},
-                timeout=TIMEOUT,
+            resultados = _buscar_por_foto(
+                request.env.cr.dbname, _base_url(),
+                contenido, archivo.filename, archivo.mimetype,
             )
-            if r.status_code >= 400:
-                # El detalle del servicio va al log: sin esto el 400 era
-                # ciego y no se sabía QUÉ rechazó.
-                _logger.warning(
-                    'Visión respondió %s en /buscar: %s',
-                    r.status_code, (r.text or '')[:500])
+            return request.make_json_response(_pagina(resultados, kw.get('offset'), limite))
+        except Exception as exc:  # noqa: BLE001
+            return request.make_json_response({'ok': False, 'error': _mensaje_error(exc)})
+
+    @http.route('/som_vision/resultado/<int:trabajo_id>', type='jsonrpc', auth='user')
+    def resultado(self, trabajo_id, offset=0):
+        """Estado de una búsqueda asíncrona; los resultados se enriquecen al
+        entregarlos, con datos de inventario vigentes. Con ``offset`` entrega
+        las páginas siguientes desde el trabajo, sin volver a subir la foto."""
+        trabajo = request.env['som.vision.job'].sudo().search([
+            ('id', '=', trabajo_id),
+            ('user_id', '=', request.env.uid),
+        ], limit=1)
+        if not trabajo:
+            return {'ok': False, 'error': 'La búsqueda ya no existe'}
+        # Su hilo murió con un worker reciclado: no va a terminar.
+        trabajo._fail_stale()
+        if trabajo.state == 'error':
+            return {'ok': False, 'estado': 'error', 'error': trabajo.error or 'No se pudo procesar la imagen'}
+        if trabajo.state != 'listo':
+            return {'ok': True, 'estado': trabajo.state}
+        return dict(
+            _pagina(trabajo.resultados or [], offset, trabajo.limite or 24),
+            estado='listo',
+        )
+
+    @http.route('/som_vision/similares', type='jsonrpc', auth='user')
+    def similares(self, attachment_id, limite=24, offset=0):
+        """Placas parecidas a un resultado ("más como esta").
+
+        El servicio ya tiene el embedding de cada foto indexada: se le pide
+        por id de adjunto, sin volver a subir ni transcodificar la imagen.
+        """
+        try:
+            attachment_id = int(attachment_id)
+        except (TypeError, ValueError):
+            return {'ok': False, 'error': 'Resultado inválido'}
+        # Solo fotos de placas: no se deja consultar cualquier adjunto.
+        adjunto = request.env['ir.attachment'].sudo().search_count([
+            ('id', '=', attachment_id),
+            ('res_model', '=', 'stock.lot.image'),
+            ('res_field', '!=', False),
+        ])
+        if not adjunto:
+            return {'ok': False, 'error': 'Resultado inválido'}
+
+        try:
+            base_url = _base_url()
+            version = _version_indice(base_url)
+            llave = None
+            if version is not None:
+                llave = (request.env.cr.dbname, base_url, version, 'similar', attachment_id)
+                resultados = _CACHE_IMAGEN.get(llave)
+                if resultados is not None:
+                    return _pagina(resultados, offset, limite)
+
+            r = _llamar('GET', '/similares/%s' % attachment_id,
+                        params={'limite': VENTANA + 1}, base_url=base_url)
             r.raise_for_status()
-            datos = _enriquecer(r.json().get('resultados', []))
-            return request.make_json_response({'ok': True, 'resultados': datos})
-        except requests.HTTPError as exc:
-            # El servicio explica el motivo (formato no admitido, etc.);
-            # mostrarlo es más útil que un genérico.
-            detalle = ''
-            try:
-                detalle = (exc.response.json() or {}).get('detail', '')
-            except Exception:  # noqa: BLE001
-                pass
-            _logger.warning('Búsqueda por imagen falló: %s | %s', exc, detalle)
-            return request.make_json_response(
-                {'ok': False, 'error': detalle or 'No se pudo procesar la imagen'}
-            )
+            # La propia foto sale primero (parecido 1.0): no aporta nada.
+            resultados = [
+                res for res in r.json().get('resultados', [])
+                if res.get('attachment_id') != attachment_id
+            ][:VENTANA]
+            if llave is not None:
+                _CACHE_IMAGEN.put(llave, resultados)
+            return _pagina(resultados, offset, limite)
         except Exception as exc:  # noqa: BLE001
-            _logger.warning('Búsqueda por imagen falló: %s', exc)
-            return request.make_json_response(
-                {'ok': False, 'error': 'No se pudo procesar la imagen'}
-            )
+            return {'ok': False, 'error': _mensaje_error(exc)}
@@ -1,3 +1,8 @@
 # -*- coding: utf-8 -*-
 from . import som_date_format
+from . import gallery_rendition
 from . import gallery_share
+from . import gallery_plate
+from . import gallery_selector
+from . import gallery_reservation_request
+from . import vision_job
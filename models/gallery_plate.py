@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.tools import SQL
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Llave de cr.precommit.data con los lotes por recalcular en la transacción.
+PENDING_LOTS_KEY = 'gallery.plate.pending_lots'
+
+# Campos cuyo cambio puede meter o sacar un lote de la tabla (o cambiar su fila).
+QUANT_PLATE_FIELDS = {
+    'lot_id', 'location_id', 'company_id', 'product_id', 'quantity',
+    'reserved_quantity', 'x_tiene_hold', 'x_grupo', 'x_acabado',
+}
+# Columnas de gallery_plate copiadas de la fuente (todas menos lot_id).
+PLATE_COLUMNS = (
+    'quant_id', 'company_id', 'location_id', 'warehouse_id', 'product_id',
+    'categ_id', 'image_id', 'name', 'block', 'pedimento', 'container', 'bundle',
+    'color', 'brand', 'lot_type', 'tone_group', 'finish', 'thickness', 'height',
+    'width', 'quantity',
+)
+LOT_PLATE_FIELDS = {
+    'name', 'product_id', 'x_bloque', 'x_pedimento', 'x_contenedor', 'x_atado',
+    'x_color', 'x_tipo', 'x_grosor', 'x_alto', 'x_ancho',
+}
+IMAGE_PLATE_FIELDS = {'lot_id', 'sequence'}
+LOCATION_PLATE_FIELDS = {'usage', 'warehouse_id'}
+TEMPLATE_PLATE_FIELDS = {'categ_id', 'x_marca'}
+# Modelos que lee el recálculo: solo estos se bajan a la base antes.
+PLATE_SOURCE_MODELS = (
+    'stock.quant', 'stock.lot', 'stock.lot.image', 'stock.location',
+    'product.product', 'product.template',
+)
+
+
+class GalleryPlate(models.Model):
+    """
+    Placas mostrables en galería: una fila por lote disponible.
+
+    Disponible = quant interno con existencia, sin reserva y sin hold (la
+    misma regla del selector en modo Inventario). La fila copia lo que el
+    selector filtra o muestra, para que busque con predicados simples e
+    indexados sobre UNA tabla en lugar de recorrer quant → lote → producto →
+    plantilla → categoría → ubicación. El catálogo público no la usa: aparta
+    y valida contra los quants en vivo.
+
+    Se mantiene sola: los cambios de quants, lotes, fotos, uso o almacén de
+    ubicaciones y categoría o marca de plantillas marcan sus lotes y se
+    recalculan antes del commit de la misma transacción. Un cron la
+    reconstruye completa para lo que no pasa por el ORM (SQL directo,
+    importaciones que escriben sin ORM).
+    """
+    _name = 'gallery.plate'
+    _description = 'Placa Disponible para Galería'
+    _order = 'id desc'
+    _log_access = False
+
+    lot_id = fields.Many2one('stock.lot', string="Lote", required=True, ondelete='cascade', readonly=True)
+    quant_id = fields.Many2one('stock.quant', string="Quant", required=True, ondelete='cascade', readonly=True)
+    company_id = fields.Many2one('res.company', string="Compañía", index=True, readonly=True)
+    location_id = fields.Many2one('stock.location', string="Ubicación", index=True, readonly=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string="Almacén", index=True, readonly=True)
+    product_id = fields.Many2one('product.product', string="Producto", index=True, readonly=True)
+    categ_id = fields.Many2one('product.category', string="Categoría", index=True, readonly=True)
+    image_id = fields.Many2one('stock.lot.image', string="Foto", index='btree_not_null', readonly=True)
+
+    name = fields.Char(string="Lote / Serie", index='trigram', readonly=True)
+    block = fields.Char(string="Bloque", index='trigram', readonly=True)
+    pedimento = fields.Char(string="Pedimento", index='trigram', readonly=True)
+    container = fields.Char(string="Contenedor", index='trigram', readonly=True)
+    bundle = fields.Char(string="Atado", index='trigram', readonly=True)
+    color = fields.Char(string="Color", index='trigram', readonly=True)
+    brand = fields.Char(string="Marca", index='trigram', readonly=True)
+    lot_type = fields.Char(string="Tipo", index=True, readonly=True)
+    tone_group = fields.Char(string="Grupo", readonly=True)
+    finish = fields.Char(string="Acabado", readonly=True)
+
+    thickness = fields.Float(string="Grosor", index=True, readonly=True)
+    height = fields.Float(string="Alto", readonly=True)
+    width = fields.Float(string="Ancho", readonly=True)
+    quantity = fields.Float(string="Cantidad", readonly=True)
+
+    _lot_unique = models.Constraint(
+        'UNIQUE(lot_id)',
+        'Solo puede haber una placa por lote.',
+    )
+
+    def init(self):
+        super().init()
+        # Solo se llena en la primera instalación; en cada actualización del
+        # módulo la tabla ya está al día y la reconstrucción completa queda
+        # para el cron.
+        self.env.cr.execute("SELECT 1 FROM gallery_plate LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._refresh_plates()
+
+    # =========================================================
+    # Mantenimiento
+    # =========================================================
+
+    @api.model
+    def _mark_lots_dirty(self, lot_ids):
+        """Agenda el recálculo de ``lot_ids`` para antes del commit."""
+        lot_ids = {lot_id for lot_id in lot_ids if lot_id}
+        if not lot_ids:
+            return
+        precommit = self.env.cr.precommit
+        pending = precommit.data.get(PENDING_LOTS_KEY)
+        if pending is None:
+            pending = precommit.data[PENDING_LOTS_KEY] = set()
+            precommit.add(self._refresh_pending_plates)
+        pending.update(lot_ids)
+
+    @api.model
+    def _refresh_pending_plates(self):
+        """
+        Recalcula ya los lotes marcados en esta transacción.
+
+        Lo llama el precommit y también quien va a leer la tabla, para no ver
+        filas atrasadas respecto a lo que la propia transacción escribió.
+        """
+        pending = self.env.cr.precommit.data.pop(PENDING_LOTS_KEY, None)
+        if pending:
+            self._refresh_plates(pending)
+
+    @api.model
+    def _refresh_plates(self, lot_ids=None):
+        """
+        Recalcula las filas de ``lot_ids`` (todas si es None).
+
+        Solo se escriben filas que cambian: se borran los lotes que dejaron
+        de estar disponibles, se actualizan las filas cuyo contenido difiere
+        y se insertan los lotes nuevos. Una reconstrucción completa sin
+        cambios no reescribe ni bloquea ninguna fila, así que no estorba a
+        las transacciones de stock que recalculan sus propios lotes.
+        """
+        for model_name in PLATE_SOURCE_MODELS:
+            self.env[model_name].flush_model()
+        cr = self.env.cr
+        if lot_ids is None:
+            lot_filter = SQL("TRUE")
+            plate_filter = SQL("TRUE")
+        else:
+            lot_filter = SQL("q.lot_id = ANY(%s)", sorted(lot_ids))
+            plate_filter = SQL("p.lot_id = ANY(%s)", sorted(lot_ids))
+
+        available = SQL(
+            """
+            q.lot_id IS NOT NULL
+            AND loc.usage = 'internal'
+            AND q.quantity > 0
+            AND q.reserved_quantity = 0
+            AND q.x_tiene_hold IS NOT TRUE
+            """
+        )
+
+        cr.execute(SQL(
+            """
+            DELETE FROM gallery_plate p
+             WHERE %(plate_filter)s
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM stock_quant q
+                      JOIN stock_location loc ON loc.id = q.location_id
+                     WHERE q.lot_id = p.lot_id
+                       AND %(available)s
+               )
+            """,
+            plate_filter=plate_filter, available=available,
+        ))
+
+        columns = SQL(", ").join(SQL.identifier(name) for name in PLATE_COLUMNS)
+        plate_values = SQL(", ").join(SQL.identifier('p', name) for name in PLATE_COLUMNS)
+        src_values = SQL(", ").join(SQL.identifier('src', name) for name in PLATE_COLUMNS)
+        assignments = SQL(", ").join(
+            SQL("%s = %s", SQL.identifier(name), SQL.identifier('src', name))
+            for name in PLATE_COLUMNS
+        )
+        cr.execute(SQL(
+            """
+            WITH available AS (
+                SELECT DISTINCT ON (q.lot_id)
+                       q.lot_id, q.id AS quant_id, q.company_id, q.location_id,
+                       loc.warehouse_id, q.product_id, q.x_grupo, q.x_acabado,
+                       SUM(q.quantity) OVER (PARTITION BY q.lot_id) AS quantity
+                  FROM stock_quant q
+                  JOIN stock_location loc ON loc.id = q.location_id
+                 WHERE %(lot_filter)s
+                   AND %(available)s
+              ORDER BY q.lot_id, q.id
+            ), src AS (
+                SELECT a.lot_id, a.quant_id, a.company_id, a.location_id, a.warehouse_id,
+                       a.product_id, pt.categ_id, img.id AS image_id, lot.name,
+                       lot.x_bloque AS block, lot.x_pedimento AS pedimento,
+                       lot.x_contenedor AS container, lot.x_atado AS bundle,
+                       lot.x_color AS color, pt.x_marca AS brand, lot.x_tipo AS lot_type,
+                       a.x_grupo AS tone_group, a.x_acabado AS finish,
+                       lot.x_grosor AS thickness, lot.x_alto AS height,
+                       lot.x_ancho AS width, a.quantity
+                  FROM available a
+                  JOIN stock_lot lot ON lot.id = a.lot_id
+                  JOIN product_product pp ON pp.id = a.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+             LEFT JOIN LATERAL (
+                        SELECT i.id FROM stock_lot_image i
+                         WHERE i.lot_id = a.lot_id
+                      ORDER BY i.id DESC
+                         LIMIT 1
+                       ) img ON TRUE
+            ), changed AS (
+                UPDATE gallery_plate p
+                   SET %(assignments)s
+                  FROM src
+                 WHERE p.lot_id = src.lot_id
+                   AND (%(plate_values)s) IS DISTINCT FROM (%(src_values)s)
+            )
+            INSERT INTO gallery_plate (lot_id, %(columns)s)
+            SELECT src.lot_id, %(src_values)s
+              FROM src
+             WHERE NOT EXISTS (SELECT 1 FROM gallery_plate p WHERE p.lot_id = src.lot_id)
+            ON CONFLICT (lot_id) DO NOTHING
+            """,
+            lot_filter=lot_filter, available=available, assignments=assignments,
+            plate_values=plate_values, src_values=src_values, columns=columns,
+        ))
+        self.invalidate_model()
+
+    @api.model
+    def _cron_refresh_plates(self):
+        self._refresh_plates()
+        _logger.info("Placas de galería reconstruidas")
+
+
+class StockQuant(models.Model):
+    _inherit = 'stock.quant'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        quants = super().create(vals_list)
+        self.env['gallery.plate']._mark_lots_dirty(quants.lot_id.ids)
+        return quants
+
+    def write(self, vals):
+        # En _write el caché ya trae el lote nuevo: el anterior se marca aquí.
+        if 'lot_id' in vals:
+            self.env['gallery.plate']._mark_lots_dirty(self.lot_id.ids)
+        return super().write(vals)
+
+    def _write(self, vals):
+        # _write y no write: las reservas, holds y recomputados guardados
+        # llegan por aquí al hacer flush.
+        if QUANT_PLATE_FIELDS.intersection(vals):
+            self.env['gallery.plate']._mark_lots_dirty(self.lot_id.ids)
+        return super()._write(vals)
+
+    def unlink(self):
+        self.env['gallery.plate']._mark_lots_dirty(self.lot_id.ids)
+        return super().unlink()
+
+
+class StockLot(models.Model):
+    _inherit = 'stock.lot'
+
+    def _write(self, vals):
+        if LOT_PLATE_FIELDS.intersection(vals):
+            self.env['gallery.plate']._mark_lots_dirty(self.ids)
+        return super()._write(vals)
+
+
+class StockLocation(models.Model):
+    _inherit = 'stock.location'
+
+    def _write(self, vals):
+        # Cambiar el uso o el almacén de una ubicación mete, saca o mueve de
+        # almacén todas las placas que tiene.
+        if self and LOCATION_PLATE_FIELDS.intersection(vals):
+            self.env.cr.execute(SQL(
+                "SELECT DISTINCT lot_id FROM stock_quant WHERE location_id = ANY(%s) AND lot_id IS NOT NULL",
+                self.ids,
+            ))
+            self.env['gallery.plate']._mark_lots_dirty(row[0] for row in self.env.cr.fetchall())
+        return super()._write(vals)
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def _write(self, vals):
+        # La categoría y la marca se copian a la placa de cada lote del producto.
+        if self and TEMPLATE_PLATE_FIELDS.intersection(vals):
+            self.env.cr.execute(SQL(
+                """
+                SELECT DISTINCT q.lot_id
+                  FROM stock_quant q
+                  JOIN product_product pp ON pp.id = q.product_id
+                 WHERE pp.product_tmpl_id = ANY(%s)
+                   AND q.lot_id IS NOT NULL
+                """,
+                self.ids,
+            ))
+            self.env['gallery.plate']._mark_lots_dirty(row[0] for row in self.env.cr.fetchall())
+        return super()._write(vals)
+
+
+class StockLotImage(models.Model):
+    _inherit = 'stock.lot.image'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        images = super().create(vals_list)
+        self.env['gallery.plate']._mark_lots_dirty(images.lot_id.ids)
+        return images
+
+    def write(self, vals):
+        # Cambiar la foto de lote o de orden cambia la portada de los lotes
+        # de antes y de después.
+        if not IMAGE_PLATE_FIELDS.intersection(vals):
+            return super().write(vals)
+        old_lot_ids = self.lot_id.ids
+        res = super().write(vals)
+        self.env['gallery.plate']._mark_lots_dirty(old_lot_ids + self.lot_id.ids)
+        return res
+
+    def unlink(self):
+        self.env['gallery.plate']._mark_lots_dirty(self.lot_id.ids)
+        return super().unlink()
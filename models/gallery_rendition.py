@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Versiones reducidas (renditions) de las fotos de placas.
+
+El catálogo público no necesita la foto original para una tarjeta de 300 px:
+se genera UNA vez cada tamaño con Pillow y se guarda en disco, con el id de la
+imagen y su write_date en la ruta. Si la foto se vuelve a tomar, cambia el
+write_date y la versión anterior se descarta sola.
+"""
+import io
+import logging
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+# Odoo 19 anula Image.init() dentro del worker: los plugins se importan
+# EXPLÍCITOS o Image.open() falla con UnidentifiedImageError.
+import PIL.JpegImagePlugin  # noqa: F401
+import PIL.PngImagePlugin   # noqa: F401
+import PIL.WebPImagePlugin  # noqa: F401
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Lado mayor en píxeles de cada tamaño. 'original' no se transforma.
+RENDITION_SIZES = {
+    'grid': 480,
+    'card': 960,
+    'lightbox': 1920,
+    'original': None,
+}
+
+# formato -> (formato Pillow, Content-Type, extensión, opciones de guardado)
+RENDITION_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+}
+
+
+def rendition_stamp(write_date):
+    """Versión de la imagen usada en rutas y URLs: write_date compacto."""
+    return write_date.strftime('%Y%m%d%H%M%S%f') if write_date else '0'
+
+
+def rendition_mimetype(fmt):
+    return RENDITION_FORMATS[fmt][1]
+
+
+def _rendition_dir(dbname, image_id):
+    return os.path.join(config.filestore(dbname), 'galeria_renditions', str(image_id))
+
+
+def build_rendition(data, size, fmt):
+    """Reduce la foto al tamaño pedido y la codifica en el formato pedido."""
+    max_side = RENDITION_SIZES[size]
+    pil_format, _mimetype, _ext, save_options = RENDITION_FORMATS[fmt]
+
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG' and max_side:
+        # Decodifica directo a escala reducida: una foto de cámara no se
+        # descomprime completa solo para volver a achicarla.
+        img.draft('RGB', (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    if pil_format == 'JPEG' or img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGB')
+    if max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    img.save(buf, format=pil_format, **save_options)
+    return buf.getvalue()
+
+
+def get_rendition_path(dbname, image_id, write_date, size, fmt, load_source):
+    """Ruta en disco de la rendition, generándola si todavía no existe.
+
+    ``load_source`` es un callable que devuelve los bytes originales; solo se
+    llama cuando hay que generar.
+    """
+    _pil_format, _mimetype, ext, _save_options = RENDITION_FORMATS[fmt]
+    stamp = rendition_stamp(write_date)
+    folder = _rendition_dir(dbname, image_id)
+    path = os.path.join(folder, '%s_%s.%s' % (stamp, size, ext))
+    if os.path.exists(path):
+        return path
+
+    data = build_rendition(load_source(), size, fmt)
+
+    os.makedirs(folder, exist_ok=True)
+    # Escritura atómica: otro worker puede estar sirviendo el mismo archivo.
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        _unlink_quietly(tmp_path)
+        raise
+
+    # Versiones de una foto anterior (otro write_date) ya no se sirven.
+    for name in os.listdir(folder):
+        if not name.startswith(stamp + '_') and not name.endswith('.tmp'):
+            _unlink_quietly(os.path.join(folder, name))
+
+    return path
+
+
+def _unlink_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        _logger.debug('No se pudo borrar la rendition %s', path)
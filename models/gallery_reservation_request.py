@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import re
+from datetime import timedelta
+
+from psycopg2 import errors
+
+from odoo import models, fields, api
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Llave generada por el navegador (UUID o similar).
+REQUEST_KEY_RE = re.compile(r'^[A-Za-z0-9-]{8,64}$')
+
+# Tiempo que se recuerda una reserva ya procesada.
+REQUEST_KEY_TTL_HOURS = 24
+
+
+class GalleryReservationRequest(models.Model):
+    """
+    Solicitudes de reserva pública ya procesadas (idempotencia).
+
+    El carrito manda una llave por intento de reserva. Si el mismo intento
+    llega otra vez (doble toque, reintento tras una respuesta lenta, recarga
+    de página), se devuelve el resultado guardado sin volver a reservar.
+    """
+    _name = 'gallery.reservation.request'
+    _description = 'Solicitud de Reserva Pública'
+
+    key = fields.Char(
+        string="Llave",
+        required=True,
+        readonly=True
+    )
+
+    share_id = fields.Many2one(
+        'gallery.share',
+        string="Catálogo",
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    result = fields.Json(
+        string="Resultado",
+        readonly=True
+    )
+
+    _share_key_unique = models.Constraint(
+        'UNIQUE(share_id, key)',
+        'La llave de la solicitud debe ser única por catálogo.',
+    )
+
+    @api.model
+    def _is_valid_key(self, key):
+        return bool(key) and bool(REQUEST_KEY_RE.match(str(key)))
+
+    @api.model
+    def _run_once(self, share, key, callback):
+        """
+        Ejecuta ``callback()`` una sola vez por (catálogo, llave).
+
+        - Ya procesada: devuelve el resultado guardado.
+        - En curso en otra petición: la inserción de la llave espera a que esa
+          petición termine y choca con el índice único; se responde
+          ``pending`` para que el navegador vuelva a preguntar.
+        - Si ``callback`` falla, la llave se descarta: un reintento con la
+          misma llave vuelve a intentar la reserva.
+        """
+        Request = self.sudo()
+        done = Request.search_fetch(
+            [('share_id', '=', share.id), ('key', '=', key)], ['result'], limit=1,
+        )
+        if done:
+            if done.result:
+                return done.result
+            return self._pending_result()
+
+        try:
+            with self.env.cr.savepoint():
+                request_rec = Request.create({'share_id': share.id, 'key': key})
+        except errors.UniqueViolation:
+            return self._pending_result()
+
+        try:
+            with self.env.cr.savepoint():
+                result = callback()
+        except Exception:
+            request_rec.unlink()
+            raise
+
+        request_rec.result = result
+        return result
+
+    @api.model
+    def _pending_result(self):
+        return {
+            'success': False,
+            'pending': True,
+            'message': 'Tu reserva ya se está procesando.',
+        }
+
+    @api.autovacuum
+    def _gc_reservation_requests(self):
+        limit = fields.Datetime.now() - timedelta(hours=REQUEST_KEY_TTL_HOURS)
+        self.sudo().search([('create_date', '<', limit)]).unlink()
@@ -0,0 +1,696 @@
+# -*- coding: utf-8 -*-
+import re
+
+from odoo import models, api, tools
+from odoo.modules.db import FunctionStatus
+from odoo.tools import SQL, sql
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Filtros de texto del selector: filtro -> campo de stock.quant (ilike).
+SELECTOR_ILIKE_FILTERS = [
+    ('product_name', 'product_id.name'),
+    ('categoria_name', 'product_id.categ_id.name'),
+    ('bloque', 'lot_id.x_bloque'),
+    ('pedimento', 'lot_id.x_pedimento'),
+    ('contenedor', 'lot_id.x_contenedor'),
+    ('atado', 'lot_id.x_atado'),
+    ('color', 'lot_id.x_color'),
+    ('marca', 'product_id.product_tmpl_id.x_marca'),
+]
+
+# Los mismos filtros sobre gallery.plate (modo Inventario).
+SELECTOR_PLATE_ILIKE_FILTERS = [
+    ('product_name', 'product_id.name'),
+    ('categoria_name', 'categ_id.name'),
+    ('bloque', 'block'),
+    ('pedimento', 'pedimento'),
+    ('contenedor', 'container'),
+    ('atado', 'bundle'),
+    ('color', 'color'),
+    ('marca', 'brand'),
+]
+
+# Facetas con conteo: faceta -> (columna de la fuente, filtros que la acotan).
+# Cada faceta se cuenta sin sus propios filtros (facetas disyuntivas): con un
+# color elegido se siguen viendo los demás colores y cuántas placas tienen.
+SELECTOR_FACETS = {
+    'color': ('color', ('color',)),
+    'grosor': ('grosor', ('grosor',)),
+    'almacen': ('warehouse_id', ('almacen_id', 'ubicacion_id')),
+    'tipo': ('tipo', ('tipo',)),
+    'marca': ('marca', ('marca',)),
+}
+
+# Columnas que esos filtros (y el número de serie) recorren con ilike.
+# Cada una lleva un índice GIN de trigramas para no barrer la tabla completa.
+SELECTOR_TRIGRAM_FIELDS = [
+    ('product.template', 'name'),
+    ('product.template', 'x_marca'),
+    ('product.category', 'name'),
+    ('stock.lot', 'name'),
+    ('stock.lot', 'x_bloque'),
+    ('stock.lot', 'x_pedimento'),
+    ('stock.lot', 'x_contenedor'),
+    ('stock.lot', 'x_atado'),
+    ('stock.lot', 'x_color'),
+]
+
+
+def _clean(value):
+    return str(value).strip() if value not in (None, False) else ''
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GalleryShare(models.Model):
+    _inherit = 'gallery.share'
+
+    # =========================================================
+    # Índices de búsqueda
+    # =========================================================
+
+    def init(self):
+        super().init()
+        self._init_selector_trigram_indexes()
+
+    @api.model
+    def _init_selector_trigram_indexes(self):
+        """
+        Índices GIN (pg_trgm) para los filtros ilike del selector.
+
+        Misma expresión que usa el ORM con ``index='trigram'``, para que el
+        planificador los aproveche con el SQL que genera el dominio. Los campos
+        que ya traen índice de trigramas desde su módulo se dejan como están.
+        Sin la extensión pg_trgm no se crea nada y el selector sigue
+        funcionando igual (solo más lento).
+        """
+        if not self.env.registry.has_trigram:
+            _logger.info("pg_trgm no disponible: se omiten los índices de búsqueda del selector")
+            return
+
+        cr = self.env.cr
+        for model_name, field_name in SELECTOR_TRIGRAM_FIELDS:
+            if model_name not in self.env:
+                continue
+            Model = self.env[model_name]
+            field = Model._fields.get(field_name)
+            if (
+                not field or not field.store or field.index == 'trigram'
+                or field.type not in ('char', 'text')
+                or not sql.column_exists(cr, Model._table, field.name)
+            ):
+                continue
+            if field.translate:
+                # Traducibles (jsonb): sin índice de trigramas del ORM no hay
+                # una expresión que coincida con la que genera la búsqueda.
+                continue
+
+            index_name = sql.make_index_name(Model._table, 'galeria_%s_trgm' % field.name)
+            if sql.index_exists(cr, index_name):
+                continue
+            expression = '("%s"::text)' % field.name
+            if self.env.registry.has_unaccent == FunctionStatus.INDEXABLE:
+                expression = 'unaccent(%s)' % expression
+            sql.create_index(
+                cr, index_name, Model._table, ['%s gin_trgm_ops' % expression], method='gin',
+            )
+
+    # =========================================================
+    # Selector (backend)
+    # =========================================================
+
+    @api.model
+    def _get_selector_quant_domain(self, filters, active_block=False):
+        """
+        Dominio de stock.quant equivalente a los filtros del selector.
+
+        Modo Inventario (mismo selector que el inventario visual):
+        'stock' = existencias internas libres; 'transit' = material en
+        tránsito SIN asignación (lo asignado a un pedido no se ofrece).
+        """
+        f = filters or {}
+        in_transit = f.get('stock_mode') == 'transit'
+
+        domain = [('company_id', '=', self.env.company.id)]
+        if in_transit:
+            domain += [
+                ('location_id.usage', '=', 'transit'),
+                ('quantity', '>', 0),
+                ('x_tiene_hold', '=', False),
+            ]
+            if 'stock.transit.line' in self.env:
+                reserved_lines = self.env['stock.transit.line'].search([
+                    ('allocation_status', '=', 'reserved'),
+                    ('lot_id', '!=', False),
+                ])
+                if reserved_lines:
+                    domain.append(('lot_id', 'not in', reserved_lines.lot_id.ids))
+        else:
+            domain += [
+                ('location_id.usage', '=', 'internal'),
+                ('quantity', '>', 0),
+                ('reserved_quantity', '=', 0),
+                ('x_tiene_hold', '=', False),
+            ]
+
+        # Filtro de almacén / ubicación
+        if _clean(f.get('ubicacion_id')).isdigit():
+            domain.append(('location_id', '=', int(f['ubicacion_id'])))
+        elif _clean(f.get('almacen_id')).isdigit():
+            domain.append(('location_id.warehouse_id', '=', int(f['almacen_id'])))
+
+        # Modo bloque activo: solo las placas del bloque abierto.
+        if active_block:
+            domain.append(('lot_id.x_bloque', '=', active_block))
+            return domain
+
+        for key, path in SELECTOR_ILIKE_FILTERS:
+            value = _clean(f.get(key))
+            if value:
+                domain.append((path, 'ilike', value))
+
+        if _clean(f.get('tipo')):
+            domain.append(('lot_id.x_tipo', '=', f['tipo']))
+        # Grupo / tono y acabado: selection del quant, igual que el inventario visual.
+        if _clean(f.get('grupo')):
+            domain.append(('x_grupo', '=', f['grupo']))
+        if _clean(f.get('acabado')):
+            domain.append(('x_acabado', '=', f['acabado']))
+
+        for key, path, operator in (
+            ('grosor', 'lot_id.x_grosor', '='),
+            ('alto_min', 'lot_id.x_alto', '>='),
+            ('ancho_min', 'lot_id.x_ancho', '>='),
+        ):
+            number = _to_float(f.get(key)) if _clean(f.get(key)) else None
+            if number is not None:
+                domain.append((path, operator, number))
+
+        # Lote / Número de serie (múltiples separados por coma)
+        parts = [p.strip() for p in _clean(f.get('numero_serie')).split(',') if p.strip()]
+        if len(parts) == 1:
+            domain.append(('lot_id.name', 'ilike', parts[0]))
+        elif parts:
+            domain.append(('lot_id.name', 'in', parts))
+
+        domain += self._get_selector_price_domain(f)
+        return domain
+
+    @api.model
+    def _get_selector_plate_domain(self, filters, active_block=False):
+        """
+        Dominio de gallery.plate equivalente a los filtros del selector en
+        modo Inventario. La tabla ya solo tiene placas internas libres, así
+        que casi todo son columnas propias e indexadas; nombre de producto,
+        categoría y precios quedan a un solo salto.
+        """
+        f = filters or {}
+        domain = [('company_id', '=', self.env.company.id)]
+
+        if _clean(f.get('ubicacion_id')).isdigit():
+            domain.append(('location_id', '=', int(f['ubicacion_id'])))
+        elif _clean(f.get('almacen_id')).isdigit():
+            domain.append(('warehouse_id', '=', int(f['almacen_id'])))
+
+        if active_block:
+            domain.append(('block', '=', active_block))
+            return domain
+
+        for key, path in SELECTOR_PLATE_ILIKE_FILTERS:
+            value = _clean(f.get(key))
+            if value:
+                domain.append((path, 'ilike', value))
+
+        for key, field_name in (
+            ('tipo', 'lot_type'),
+            ('grupo', 'tone_group'),
+            ('acabado', 'finish'),
+        ):
+            if _clean(f.get(key)):
+                domain.append((field_name, '=', f[key]))
+
+        for key, field_name, operator in (
+            ('grosor', 'thickness', '='),
+            ('alto_min', 'height', '>='),
+            ('ancho_min', 'width', '>='),
+        ):
+            number = _to_float(f.get(key)) if _clean(f.get(key)) else None
+            if number is not None:
+                domain.append((field_name, operator, number))
+
+        parts = [p.strip() for p in _clean(f.get('numero_serie')).split(',') if p.strip()]
+        if len(parts) == 1:
+            domain.append(('name', 'ilike', parts[0]))
+        elif parts:
+            domain.append(('name', 'in', parts))
+
+        domain += self._get_selector_price_domain(f)
+        return domain
+
+    @api.model
+    def _get_selector_price_domain(self, f):
+        """
+        Filtro de precios: MISMA semántica que el inventario visual —
+        divisa (USD por defecto) + rango; el producto pasa si CUALQUIERA de
+        sus niveles de precio cae dentro del rango.
+        """
+        price_min = _to_float(f.get('price_min')) if _clean(f.get('price_min')) else None
+        price_max = _to_float(f.get('price_max')) if _clean(f.get('price_max')) else None
+        if price_min is None and price_max is None:
+            return []
+
+        currency = _clean(f.get('price_currency') or 'USD').lower()
+        if not re.fullmatch(r'[a-z]{3}', currency):
+            return []
+
+        Product = self.env['product.product']
+        level_domains = []
+        for level in (1, 2, 3):
+            field_name = 'x_price_{}_{}'.format(currency, level)
+            if field_name not in Product._fields:
+                continue
+            level_domain = [('product_id.' + field_name, '!=', False)]
+            if price_min is not None:
+                level_domain.append(('product_id.' + field_name, '>=', price_min))
+            if price_max is not None:
+                level_domain.append(('product_id.' + field_name, '<=', price_max))
+            level_domains.append(level_domain)
+
+        if not level_domains:
+            return []
+        # OR entre niveles, AND dentro de cada nivel.
+        domain = ['|'] * (len(level_domains) - 1)
+        for level_domain in level_domains:
+            domain += ['&'] * (len(level_domain) - 1) + level_domain
+        return domain
+
+    @api.model
+    def _get_selector_lot_query(self, domain, min_block_qty=0.0):
+        """
+        SQL con los lotes de los quants que cumplen el dominio.
+
+        Cant. mínima por bloque (m²): igual que el inventario visual, se suma
+        la existencia del bloque completo y se descartan los bloques por
+        debajo del mínimo (ventana SQL, sin leer los quants a Python).
+        """
+        query = self.env['stock.quant']._search(domain)
+        return SQL(
+            """
+            SELECT DISTINCT sub.lot_id
+              FROM (
+                    SELECT q.lot_id,
+                           SUM(q.quantity) OVER (PARTITION BY COALESCE(l.x_bloque, '')) AS block_qty
+                      FROM stock_quant q
+                      JOIN stock_lot l ON l.id = q.lot_id
+                     WHERE q.id IN %s
+                   ) sub
+             WHERE sub.block_qty >= %s
+            """,
+            query.subselect(), min_block_qty or 0.0,
+        )
+
+    @api.model
+    def _get_selector_plate_lot_query(self, domain, min_block_qty=0.0):
+        """Como ``_get_selector_lot_query``, sobre gallery.plate (una sola tabla)."""
+        query = self.env['gallery.plate']._search(domain)
+        return SQL(
+            """
+            SELECT sub.lot_id
+              FROM (
+                    SELECT p.lot_id,
+                           SUM(p.quantity) OVER (PARTITION BY COALESCE(p.block, '')) AS block_qty
+                      FROM gallery_plate p
+                     WHERE p.id IN %s
+                   ) sub
+             WHERE sub.block_qty >= %s
+            """,
+            query.subselect(), min_block_qty or 0.0,
+        )
+
+    @api.model
+    def _get_selector_lot_ids(self, domain, min_block_qty=0.0):
+        """Lotes de los quants que cumplen el dominio, en una sola consulta."""
+        self.env.cr.execute(self._get_selector_lot_query(domain, min_block_qty))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _get_selector_plate_lot_ids(self, domain, min_block_qty=0.0):
+        """Lotes de gallery.plate que cumplen el dominio, en una sola consulta."""
+        self.env.cr.execute(self._get_selector_plate_lot_query(domain, min_block_qty))
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _get_selector_image_query(self, filters, active_block=False):
+        """
+        Query de stock.lot.image (con reglas de acceso) de las placas que
+        cumplen los filtros, más recientes primero. Los lotes quedan como
+        subconsulta: nada del resultado pasa por Python.
+
+        Modo Inventario: desde gallery.plate. Tránsito: desde los quants, que
+        la tabla de placas no cubre.
+        """
+        filters = filters or {}
+        min_block_qty = _to_float(filters.get('cantidad_min_bloque')) or 0.0
+        if filters.get('stock_mode') == 'transit':
+            domain = self._get_selector_quant_domain(filters, active_block=active_block)
+            lot_query = self._get_selector_lot_query(domain, min_block_qty)
+        else:
+            self.env['gallery.plate']._refresh_pending_plates()
+            domain = self._get_selector_plate_domain(filters, active_block=active_block)
+            lot_query = self._get_selector_plate_lot_query(domain, min_block_qty)
+
+        query = self.env['stock.lot.image']._search([], order='id desc')
+        query.add_where(SQL("%s IN (%s)", SQL.identifier(query.table, 'lot_id'), lot_query))
+        return query
+
+    @api.model
+    def search_selector_image_ids(self, filters=None, active_block=False):
+        """Ids de TODAS las imágenes del resultado (botón "Todo" del selector).
+
+        La grilla solo tiene cargadas las páginas visibles; la selección
+        completa se resuelve aquí sin traer los items.
+        """
+        self.env.cr.execute(self._get_selector_image_query(filters, active_block).select())
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def search_selector_items(self, filters=None, offset=0, limit=None, active_block=False):
+        """
+        Búsqueda del selector de galería en una sola llamada.
+
+        Arma el dominio, aplica el mínimo por bloque y los precios en SQL y
+        devuelve los items ya agrupados (bloques primero, luego placas
+        sueltas) para la página pedida, junto con el total de items y, en la
+        primera página, los conteos por faceta del resultado.
+
+        La agrupación por bloque, el orden y el ``offset``/``limit`` se
+        resuelven en la consulta: solo se leen las imágenes de la página.
+        """
+        image_query = self._get_selector_image_query(filters, active_block=active_block)
+        offset = max(0, int(offset or 0))
+
+        # Bloques (por x_bloque, el más reciente primero) y luego placas
+        # sueltas; en modo bloque activo todo va como placa suelta.
+        entries = SQL(
+            """
+            WITH img AS (
+                SELECT i.id,
+                       CASE WHEN %(force_singles)s THEN NULL ELSE NULLIF(lot.x_bloque, '') END AS block
+                  FROM stock_lot_image i
+                  JOIN stock_lot lot ON lot.id = i.lot_id
+                 WHERE i.id IN %(images)s
+            )
+            SELECT 0 AS kind, block, MAX(id) AS sort_id,
+                   ARRAY_AGG(id ORDER BY id DESC) AS image_ids
+              FROM img
+             WHERE block IS NOT NULL
+          GROUP BY block
+            UNION ALL
+            SELECT 1, NULL, id, ARRAY[id]
+              FROM img
+             WHERE block IS NULL
+            """,
+            force_singles=bool(active_block), images=image_query.subselect(),
+        )
+        self.env.cr.execute(SQL(
+            """
+            SELECT e.kind, e.block, e.image_ids, COUNT(*) OVER ()
+              FROM (%s) e
+          ORDER BY e.kind, e.sort_id DESC
+             LIMIT %s OFFSET %s
+            """,
+            entries, int(limit) if limit else None, offset,
+        ))
+        page = self.env.cr.fetchall()
+        if page:
+            total = page[0][3]
+        elif offset:
+            self.env.cr.execute(SQL("SELECT COUNT(*) FROM (%s) e", entries))
+            total = self.env.cr.fetchone()[0]
+        else:
+            total = 0
+        if not total:
+            return {'items': [], 'total': 0, 'facets': {}}
+
+        # Conteos por faceta solo con la primera página: las siguientes son
+        # del mismo resultado.
+        facets = {}
+        if not offset and not active_block:
+            facets = self._get_selector_facet_counts(filters, image_query)
+
+        Image = self.env['stock.lot.image']
+        page_images = Image.browse([image_id for _k, _b, image_ids, _t in page for image_id in image_ids])
+        page_images.fetch(['lot_id', 'write_date'])
+        page_lots = page_images.lot_id
+        page_lots.fetch(['name', 'x_alto', 'x_ancho', 'product_id'])
+        page_lots.product_id.mapped('display_name')
+
+        items = []
+        for kind, block, image_ids, _total in page:
+            if kind == 1:
+                items.append(self._prepare_selector_single(Image.browse(image_ids[0])))
+                continue
+            children = [self._prepare_selector_single(image) for image in Image.browse(image_ids)]
+            cover = Image.browse(image_ids[0])
+            items.append({
+                'type': 'block',
+                'key': block,
+                'name': 'Bloque {}'.format(block),
+                'product_name': children[0]['product_name'],
+                'ids': [child['id'] for child in children],
+                'total_area': sum(child['area'] for child in children),
+                'cover_id': cover.id,
+                'cover_unique': str(cover.write_date or ''),
+            })
+
+        return {'items': items, 'total': total, 'facets': facets}
+
+    @api.model
+    def _get_selector_facet_counts(self, filters, image_query):
+        """
+        Placas por valor de cada faceta (color, grosor, almacén, tipo,
+        marca), para que el vendedor vea cuántas hay antes de filtrar.
+
+        Facetas disyuntivas: cada una se cuenta con todos los filtros MENOS
+        los suyos, así que la faceta ya elegida sigue mostrando sus otros
+        valores. Las facetas sin filtro propio comparten el resultado actual
+        y salen de una sola consulta con GROUPING SETS; cada faceta con
+        filtro activo suma una consulta sobre su resultado relajado.
+
+        ``image_query``: Query de stock.lot.image del resultado actual.
+
+        Devuelve {faceta: [[valor, etiqueta, placas], ...]} de mayor a menor.
+        """
+        filters = filters or {}
+        active = [
+            name for name, (_column, keys) in SELECTOR_FACETS.items()
+            if any(_clean(filters.get(key)) for key in keys)
+        ]
+        counts = {name: [] for name in SELECTOR_FACETS}
+
+        shared = [name for name in SELECTOR_FACETS if name not in active]
+        if shared:
+            counts.update(self._count_selector_facets(filters, image_query, shared))
+        for name in active:
+            own_keys = SELECTOR_FACETS[name][1]
+            relaxed = {key: value for key, value in filters.items() if key not in own_keys}
+            relaxed_query = self._get_selector_image_query(relaxed)
+            counts.update(self._count_selector_facets(relaxed, relaxed_query, [name]))
+
+        warehouses = self.env['stock.warehouse'].browse([v for v, _l, _c in counts['almacen']])
+        warehouse_names = dict(zip(warehouses.ids, warehouses.mapped('name')))
+        for entry in counts['almacen']:
+            entry[1] = warehouse_names.get(entry[0], '')
+        tipo_field = self.env['stock.lot']._fields.get('x_tipo')
+        if tipo_field and tipo_field.type == 'selection':
+            tipo_labels = dict(tipo_field._description_selection(self.env))
+            for entry in counts['tipo']:
+                entry[1] = tipo_labels.get(entry[0], entry[0])
+        for entry in counts['grosor']:
+            entry[0] = float(entry[0])
+            entry[1] = '{:g}'.format(entry[0])
+
+        for entries in counts.values():
+            entries.sort(key=lambda entry: -entry[2])
+        return counts
+
+    @api.model
+    def _count_selector_facets(self, filters, image_query, names):
+        """
+        Conteo crudo de las facetas ``names`` sobre las placas de
+        ``image_query``, en una consulta agregada con GROUPING SETS.
+
+        Devuelve {faceta: [[valor, valor, placas], ...]}.
+        """
+        lot_query = SQL(
+            "SELECT i.lot_id FROM stock_lot_image i WHERE i.id IN %s",
+            image_query.subselect(),
+        )
+        if filters.get('stock_mode') == 'transit':
+            query = self.env['stock.quant']._search(self._get_selector_quant_domain(filters))
+            source = SQL(
+                """
+                SELECT q.lot_id, lot.x_color AS color, lot.x_grosor AS grosor,
+                       l.warehouse_id, lot.x_tipo AS tipo, pt.x_marca AS marca
+                  FROM stock_quant q
+                  JOIN stock_location l ON l.id = q.location_id
+                  JOIN stock_lot lot ON lot.id = q.lot_id
+                  JOIN product_product pp ON pp.id = q.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                 WHERE q.id IN %s
+                   AND q.lot_id IN (%s)
+                """,
+                query.subselect(), lot_query,
+            )
+        else:
+            # Los lotes ya vienen filtrados: basta con sus filas de placa.
+            source = SQL(
+                """
+                SELECT p.lot_id, p.color, p.thickness AS grosor,
+                       p.warehouse_id, p.lot_type AS tipo, p.brand AS marca
+                  FROM gallery_plate p
+                 WHERE p.lot_id IN (%s)
+                """,
+                lot_query,
+            )
+        columns = [SQL.identifier('s', SELECTOR_FACETS[name][0]) for name in names]
+        self.env.cr.execute(SQL(
+            """
+            SELECT %(groupings)s, %(columns)s, COUNT(DISTINCT s.lot_id)
+              FROM (%(source)s) s
+          GROUP BY GROUPING SETS (%(sets)s)
+            """,
+            groupings=SQL(", ").join(SQL("GROUPING(%s)", column) for column in columns),
+            columns=SQL(", ").join(columns),
+            sets=SQL(", ").join(SQL("(%s)", column) for column in columns),
+            source=source,
+        ))
+        counts = {name: [] for name in names}
+        size = len(names)
+        for row in self.env.cr.fetchall():
+            grouping, values, count = row[:size], row[size:2 * size], row[-1]
+            # GROUPING() = 0 marca la columna agrupada en este conjunto.
+            index = grouping.index(0)
+            value = values[index]
+            if value in (None, ''):
+                continue
+            counts[names[index]].append([value, value, count])
+        return counts
+
+    @api.model
+    def _prepare_selector_single(self, image):
+        lot = image.lot_id
+        alto = lot.x_alto or 0.0
+        ancho = lot.x_ancho or 0.0
+        unique = str(image.write_date or '')
+        return {
+            'type': 'single',
+            'key': image.id,
+            'id': image.id,
+            'lot_name': lot.name,
+            'name': lot.name,
+            'dims': '{:.2f} x {:.2f}'.format(alto, ancho),
+            'area': alto * ancho,
+            'unique': unique,
+            'product_name': lot.product_id.display_name if lot.product_id else 'Producto',
+            'cover_id': image.id,
+            'cover_unique': unique,
+        }
+
+    # =========================================================
+    # Opciones de filtros (facetas)
+    # =========================================================
+
+    @api.model
+    def get_selector_facets(self):
+        """
+        Todas las opciones de filtro del selector en una sola llamada.
+
+        Solo valores con existencia interna de la empresa actual. Se guarda
+        en caché por empresa; la llave incluye la última escritura y el número
+        de quants con existencia, así que cualquier alta, cambio o baja de
+        quant invalida la caché sin hooks.
+        """
+        company_id = self.env.company.id
+        self.env.cr.execute(SQL(
+            """
+            SELECT MAX(q.write_date), COUNT(*)
+              FROM stock_quant q
+              JOIN stock_location l ON l.id = q.location_id
+             WHERE q.company_id = %s
+               AND l.usage = 'internal'
+               AND q.quantity > 0
+            """,
+            company_id,
+        ))
+        stamp = tuple(self.env.cr.fetchone())
+        return self._get_selector_facets_cached(company_id, stamp, self.env.lang)
+
+    @tools.ormcache('company_id', 'stamp', 'lang')
+    def _get_selector_facets_cached(self, company_id, stamp, lang):
+        self.env.cr.execute(SQL(
+            """
+            WITH stock AS (
+                SELECT q.lot_id, q.product_id, l.warehouse_id
+                  FROM stock_quant q
+                  JOIN stock_location l ON l.id = q.location_id
+                 WHERE q.company_id = %s
+                   AND l.usage = 'internal'
+                   AND q.quantity > 0
+            ), stock_lot_data AS (
+                SELECT DISTINCT lot.x_bloque, lot.x_color, lot.x_grosor
+                  FROM stock s
+                  JOIN stock_lot lot ON lot.id = s.lot_id
+            ), stock_product AS (
+                SELECT DISTINCT pt.categ_id, pt.x_marca
+                  FROM stock s
+                  JOIN product_product pp ON pp.id = s.product_id
+                  JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            )
+            SELECT 'almacen', w.id::text, w.name
+              FROM stock_warehouse w
+             WHERE w.id IN (SELECT warehouse_id FROM stock)
+            UNION ALL
+            SELECT 'categoria', c.id::text, c.name
+              FROM product_category c
+             WHERE c.id IN (SELECT categ_id FROM stock_product)
+            UNION ALL
+            SELECT DISTINCT 'marca', x_marca, x_marca
+              FROM stock_product WHERE COALESCE(x_marca, '') != ''
+            UNION ALL
+            SELECT DISTINCT 'bloque', x_bloque, x_bloque
+              FROM stock_lot_data WHERE COALESCE(x_bloque, '') != ''
+            UNION ALL
+            SELECT DISTINCT 'color', x_color, x_color
+              FROM stock_lot_data WHERE COALESCE(x_color, '') != ''
+            UNION ALL
+            SELECT DISTINCT 'grosor', x_grosor::text, x_grosor::text
+              FROM stock_lot_data WHERE x_grosor IS NOT NULL
+            """,
+            company_id,
+        ))
+        values = {}
+        for facet, key, label in self.env.cr.fetchall():
+            values.setdefault(facet, []).append((key, label))
+
+        def by_label(facet):
+            return sorted(values.get(facet, []), key=lambda kv: (kv[1] or '').lower())
+
+        tipo_field = self.env['stock.lot']._fields.get('x_tipo')
+        return {
+            'almacenes': [{'id': int(key), 'name': label} for key, label in by_label('almacen')],
+            'tipos': tipo_field._description_selection(self.env) if tipo_field and tipo_field.type == 'selection' else [],
+            'categorias': [{'id': int(key), 'name': label} for key, label in by_label('categoria')],
+            'grupos': [[key, label] for key, label in by_label('bloque')],
+            'grosores': sorted(float(key) for key, _label in values.get('grosor', [])),
+            'marcas': [key for key, _label in by_label('marca')],
+            'colores': [key for key, _label in by_label('color')],
+        }
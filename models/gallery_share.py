@@ -1,17 +1,42 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import json
 import uuid
 import re
+from collections import defaultdict
 from datetime import timedelta
 from urllib.parse import quote
 
-from odoo import models, fields, api, _
+from markupsafe import Markup
+from psycopg2 import errors
+
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError
+from odoo.tools import SQL
 from odoo.addons.galeria.models.som_date_format import som_format_date
+from odoo.addons.galeria.models.gallery_rendition import rendition_stamp
 
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# === Reglas de agrupación visual ===
+# Un bloque (lotes con mismo x_bloque) se muestra agrupado solo si:
+#   1. Tiene 5 o más placas (más de 4)
+#   2. La CATEGORÍA a la que pertenece tiene 4 o más bloques de ese tamaño
+# De lo contrario, las placas se muestran individuales (evita cards solitarios).
+THRESHOLD_BLOCK_SIZE = 5
+THRESHOLD_CATEGORY_BLOCKS = 4
+
+# write_date es la hora de INICIO de la transacción: una venta larga puede
+# confirmarse después de un sondeo con fecha anterior al sondeo. Cada sondeo
+# revisa también este margen hacia atrás (el cliente aplica el estado de forma
+# idempotente, repetir un lote no importa).
+AVAILABILITY_OVERLAP = timedelta(seconds=120)
+
+# Campos que viajan en la caché de acceso por token (_get_public_share_access).
+PUBLIC_ACCESS_FIELDS = {'access_token', 'expiration_date', 'company_id', 'image_ids'}
+
 
 class GalleryShare(models.Model):
     _name = 'gallery.share'
@@ -92,16 +117,40 @@ class GalleryShare(models.Model):
         readonly=True
     )
 
+    # Catálogo ya agrupado y ordenado tal como lo pinta /gallery/view.
+    # catalog_snapshot_key es la versión del inventario con la que se calculó
+    # (_get_catalog_version): si cambia un quant, un hold, una foto, un
+    # producto o una categoría de los lotes incluidos, deja de coincidir y el
+    # catálogo se recalcula en la siguiente visita.
+    catalog_snapshot = fields.Json(
+        string="Catálogo precalculado",
+        copy=False,
+        readonly=True
+    )
+
+    catalog_snapshot_key = fields.Char(
+        string="Versión del catálogo precalculado",
+        copy=False,
+        readonly=True
+    )
+
+    # Índice único: las rutas públicas buscan el catálogo por token.
+    _access_token_unique = models.Constraint(
+        'UNIQUE(access_token)',
+        'El token de acceso debe ser único.',
+    )
+
     # =========================================================
     # CRUD / Computed fields
     # =========================================================
 
     @api.model_create_multi
     def create(self, vals_list):
-        for vals in vals_list:
-            if vals.get('name', 'Nuevo') == 'Nuevo':
-                vals['name'] = self.env['ir.sequence'].next_by_code('gallery.share') or 'CAT/0000'
+        unnamed = [vals for vals in vals_list if vals.get('name', 'Nuevo') == 'Nuevo']
+        for vals, name in zip(unnamed, self._reserve_share_names(len(unnamed))):
+            vals['name'] = name
 
+        for vals in vals_list:
             if not vals.get('expiration_date'):
                 # DOS MESES de vigencia: el catálogo se comparte con clientes
                 # que deciden con calma; expirar a los pocos días mataba
@@ -113,6 +162,59 @@ class GalleryShare(models.Model):
 
         return super(GalleryShare, self).create(vals_list)
 
+    @api.model
+    def _reserve_share_names(self, count):
+        """
+        ``count`` folios de la secuencia gallery.share.
+
+        Con la secuencia estándar (secuencia de PostgreSQL, sin rangos por
+        fecha) todos salen de un solo nextval sobre generate_series en lugar
+        de una llamada a next_by_code por catálogo. Cualquier otra
+        configuración cae a next_by_code, que sabe manejarla.
+        """
+        if not count:
+            return []
+        IrSequence = self.env['ir.sequence']
+        sequence = IrSequence.sudo().search([
+            ('code', '=', 'gallery.share'),
+            ('company_id', 'in', [self.env.company.id, False]),
+        ], order='company_id', limit=1)
+        if count == 1 or not sequence or sequence.implementation != 'standard' or sequence.use_date_range:
+            return [IrSequence.next_by_code('gallery.share') or 'CAT/0000' for _i in range(count)]
+        self.env.cr.execute(SQL(
+            "SELECT nextval(%s) FROM generate_series(1, %s)",
+            'ir_sequence_%03d' % sequence.id, count,
+        ))
+        return [sequence.get_next_char(row[0]) for row in self.env.cr.fetchall()]
+
+    def write(self, vals):
+        # El acceso por token vive en caché (ormcache, compartida entre
+        # workers vía señal de invalidación). ormcache solo se limpia por
+        # grupo completo y un grupo propio no sirve: el registro crea sus
+        # grupos antes de importar los módulos. Por eso se limpia únicamente
+        # si cambió de verdad algo de lo que guarda; chatter, tracking,
+        # snapshot o un guardado con los mismos valores no la tocan.
+        before = None
+        if PUBLIC_ACCESS_FIELDS & set(vals):
+            before = {record.id: record._get_public_access_values() for record in self}
+        res = super(GalleryShare, self).write(vals)
+        if before and any(before[record.id] != record._get_public_access_values() for record in self):
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        # Un catálogo sin token nunca entró a la caché: borrarlo no la limpia.
+        had_token = any(self.mapped('access_token'))
+        res = super(GalleryShare, self).unlink()
+        if had_token:
+            self.env.registry.clear_cache()
+        return res
+
+    def _get_public_access_values(self):
+        """Lo que la caché de acceso por token guarda de este catálogo."""
+        self.ensure_one()
+        return (self.access_token, self.company_id.id, self.expiration_date, frozenset(self.image_ids.ids))
+
     @api.depends('expiration_date')
     def _compute_is_expired(self):
         now = fields.Datetime.now()
@@ -161,6 +263,15 @@ class GalleryShare(models.Model):
         if not self.share_url:
             raise UserError('Este catálogo aún no tiene liga generada.')
 
+        number, url = self._get_customer_whatsapp_link()
+        self.message_post(body='Catálogo enviado por WhatsApp%s.' % (
+            ' al %s' % number if number else ''))
+        return {'type': 'ir.actions.act_url', 'url': url, 'target': 'new'}
+
+    def _get_customer_whatsapp_link(self):
+        """Número del cliente y liga wa.me con el mensaje del catálogo."""
+        self.ensure_one()
+
         partner = self.partner_id
         number = self._clean_phone_digits(
             (partner.phone or '') if partner else '')
@@ -189,11 +300,11 @@ class GalleryShare(models.Model):
         ) % (saludo, self.share_url, vigencia)
 
         url = 'https://wa.me/%s?text=%s' % (number, quote(message, safe=''))
-        self.message_post(body='Catálogo enviado por WhatsApp%s.' % (
-            ' al %s' % number if number else ''))
-        return {'type': 'ir.actions.act_url', 'url': url, 'target': 'new'}
+        return number, url
 
     def action_regenerate_token(self):
+        # write() invalida la caché de acceso por token: la liga anterior deja
+        # de funcionar en todos los workers.
         for record in self:
             record.access_token = str(uuid.uuid4())
 
@@ -236,6 +347,65 @@ class GalleryShare(models.Model):
             'url': share.share_url,
         }
 
+    @api.model
+    def create_from_selector_multi(self, partner_ids, image_ids, send_email=False):
+        """
+        Un catálogo por cliente con la MISMA selección, en un solo create
+        (las filas de imágenes de todos se insertan juntas y los folios se
+        reservan de una vez, ver _reserve_share_names).
+
+        Con ``send_email`` el correo de cada catálogo queda en la cola de
+        correo; WhatsApp no se puede enviar desde el servidor, así que se
+        devuelve la liga wa.me de cada cliente para abrirla desde el diálogo.
+        """
+        partners = self.env['res.partner'].browse(list(dict.fromkeys(partner_ids or []))).exists()
+        if not partners:
+            raise UserError('Selecciona al menos un cliente.')
+        if not image_ids:
+            raise UserError('No hay imágenes seleccionadas.')
+
+        company_id = self.env.company.id
+        shares = self.create([{
+            'partner_id': partner.id,
+            'image_ids': [(6, 0, image_ids)],
+            'company_id': company_id,
+        } for partner in partners])
+
+        emailed = self.browse()
+        if send_email:
+            emailed = shares.filtered(lambda share: share.partner_id.email)
+            emailed._queue_share_email()
+
+        result = []
+        for share in shares:
+            number, whatsapp_url = share._get_customer_whatsapp_link()
+            result.append({
+                'id': share.id,
+                'name': share.name,
+                'partner_id': share.partner_id.id,
+                'partner_name': share.partner_id.name,
+                'url': share.share_url,
+                'whatsapp_url': whatsapp_url if number else False,
+                'emailed': share in emailed,
+            })
+        return result
+
+    def _queue_share_email(self):
+        """Deja en la cola de correo el envío de cada catálogo a su cliente."""
+        template = self.env.ref('galeria.email_template_gallery_share', raise_if_not_found=False)
+        for share in self.with_context(mail_notify_force_send=False):
+            if template:
+                share.message_post_with_source(template, subtype_xmlid='mail.mt_comment')
+                continue
+            share.message_post(
+                body=Markup(
+                    'Le compartimos su catálogo personalizado de materiales: '
+                    '<a href="%s">%s</a>'
+                ) % (share.share_url, share.share_url),
+                partner_ids=share.partner_id.ids,
+                subtype_xmlid='mail.mt_comment',
+            )
+
     @api.model
     def get_current_company(self):
         return self.env.company.id
@@ -471,6 +641,480 @@ class GalleryShare(models.Model):
             'salesperson_name': self.user_id.name or '',
         }
 
+    # =========================================================
+    # Acceso público por token
+    # =========================================================
+
+    @api.model
+    def _get_public_share_access(self, token):
+        """
+        Datos de acceso del catálogo para un token público:
+        (share_id, company_id, expiration_date, image_ids) o None si el token
+        no existe. image_ids es un frozenset: saber si una imagen pertenece al
+        catálogo cuesta O(1) y ninguna consulta.
+
+        Las imágenes de un catálogo llegan de a cientos por página; con la
+        caché solo la primera petición consulta gallery_share.
+        """
+        try:
+            # Solo tokens con forma de UUID llegan a la caché: así un barrido
+            # de tokens inventados no desplaza las entradas buenas.
+            token = str(uuid.UUID(str(token)))
+        except ValueError:
+            return None
+        return self._get_public_share_access_cached(token)
+
+    @api.model
+    @tools.ormcache('token')
+    def _get_public_share_access_cached(self, token):
+        share = self.sudo().search([('access_token', '=', token)], limit=1)
+        if not share:
+            return None
+        _token, company_id, expiration_date, image_ids = share._get_public_access_values()
+        return (share.id, company_id, expiration_date, image_ids)
+
+    # =========================================================
+    # Disponibilidad pública
+    # =========================================================
+
+    def _get_available_quants_by_lot(self, lots):
+        """
+        Resuelve en bloque qué quant representa a cada lote en la galería.
+
+        Mismas reglas que la búsqueda por placa de antes, pero en un número
+        fijo de consultas sin importar el tamaño del catálogo:
+        1. Un quant interno con existencia, sin reservas ni hold.
+        2. Si no hay, el primer quant interno con reserva y sin hold cuya
+           reserva provenga COMPLETA de traslados internos de carrito abiertos
+           (reserva débil, se libera sola al vender).
+
+        Lee los quants en vivo y no gallery.plate: el catálogo público aparta
+        y valida carritos con esto, y la tabla puede ir atrasada respecto a
+        lo que escriben otras transacciones o el SQL directo hasta el cron.
+
+        Devuelve {lot_id: stock.quant}.
+        """
+        self.ensure_one()
+
+        if not lots:
+            return {}
+
+        Quant = self.env['stock.quant'].sudo().with_company(self.company_id)
+        quants = Quant.search_fetch([
+            ('lot_id', 'in', lots.ids),
+            ('company_id', '=', self.company_id.id),
+            ('location_id.usage', '=', 'internal'),
+            ('quantity', '>', 0),
+            ('x_tiene_hold', '=', False),
+        ], ['lot_id', 'location_id', 'product_id', 'quantity', 'reserved_quantity', 'write_date'])
+
+        free_by_lot = {}
+        candidate_by_lot = {}
+        for quant in quants:
+            lot_id = quant.lot_id.id
+            if not quant.reserved_quantity:
+                free_by_lot.setdefault(lot_id, quant)
+            else:
+                candidate_by_lot.setdefault(lot_id, quant)
+
+        # Reserva DÉBIL: si la placa solo está retenida por un traslado
+        # interno de carrito/escáner ABIERTO (reacomodo de ubicación), sigue
+        # vendible y debe mostrarse en la galería; esa reserva se libera sola
+        # al crear la venta. Una sola consulta agrupada por (lote, ubicación).
+        pending = {
+            lot_id: quant for lot_id, quant in candidate_by_lot.items()
+            if lot_id not in free_by_lot
+        }
+        weak_by_key = {}
+        if pending:
+            groups = self.env['stock.move.line'].sudo()._read_group([
+                ('lot_id', 'in', list(pending)),
+                ('location_id', 'in', list({q.location_id.id for q in pending.values()})),
+                ('state', 'in', ('assigned', 'partially_available')),
+                ('picking_id.picking_type_code', '=', 'internal'),
+                ('picking_id.origin', '=like', 'Carrito - %'),
+                ('picking_id.state', 'not in', ('done', 'cancel')),
+            ], ['lot_id', 'location_id'], ['quantity:sum'])
+            weak_by_key = {
+                (lot.id, location.id): quantity or 0.0
+                for lot, location, quantity in groups
+            }
+
+        result = dict(free_by_lot)
+        for lot_id, quant in pending.items():
+            weak_reserved = weak_by_key.get((lot_id, quant.location_id.id), 0.0)
+            if weak_reserved >= (quant.reserved_quantity or 0.0):
+                result[lot_id] = quant
+
+        return result
+
+    def _get_public_availability_changes(self, since):
+        """
+        Cambios de disponibilidad de los lotes del catálogo desde ``since``.
+
+        Un lote se vuelve a resolver solo si desde entonces se escribió alguno
+        de sus quants, movimientos (venta, traslado de carrito) o líneas de
+        hold; el resto no se toca. Sin ``since`` solo se devuelve la versión.
+
+        Devuelve {'version', 'available': [[lot_id, quant_id]], 'unavailable': [lot_id]}.
+        """
+        self.ensure_one()
+
+        result = {
+            'version': fields.Datetime.to_string(fields.Datetime.now()),
+            'available': [],
+            'unavailable': [],
+        }
+        lots = self.image_ids.lot_id
+        if not since or not lots:
+            return result
+
+        since = since - AVAILABILITY_OVERLAP
+        changed = self.env['stock.lot']
+        for model_name in ('stock.quant', 'stock.move.line'):
+            groups = self.env[model_name].sudo()._read_group([
+                ('lot_id', 'in', lots.ids),
+                ('write_date', '>', since),
+            ], ['lot_id'])
+            for (lot,) in groups:
+                changed |= lot
+
+        HoldOrder = self.env['stock.lot.hold.order']
+        HoldLine = self.env[HoldOrder._fields['hold_line_ids'].comodel_name].sudo()
+        hold_domain = [('write_date', '>', since)]
+        if 'lot_ids' in HoldLine._fields:
+            hold_domain += ['|', ('lot_id', 'in', lots.ids), ('lot_ids', 'in', lots.ids)]
+        else:
+            hold_domain += [('lot_id', 'in', lots.ids)]
+        hold_lines = HoldLine.search_fetch(hold_domain, ['lot_id'])
+        changed |= hold_lines.lot_id
+        if 'lot_ids' in HoldLine._fields:
+            changed |= hold_lines.lot_ids
+
+        changed &= lots
+        if not changed:
+            return result
+
+        quant_by_lot = self._get_available_quants_by_lot(changed)
+        for lot in changed:
+            quant = quant_by_lot.get(lot.id)
+            if quant:
+                result['available'].append([lot.id, quant.id])
+            else:
+                result['unavailable'].append(lot.id)
+        return result
+
+    def _get_public_cart_status(self, lot_ids):
+        """
+        Estado de cada lote del carrito público, con las mismas reglas que
+        el catálogo:
+
+        - 'available': quant libre.
+        - 'weak': solo lo retiene un traslado interno de carrito (se libera
+          solo al reservar).
+        - 'held': sigue en existencia pero con hold o reserva de otro.
+        - 'gone': ya no hay existencia interna (vendido) o no es del catálogo.
+
+        Devuelve {lot_id: (estado, quant_id o False)}.
+        """
+        self.ensure_one()
+
+        catalog_lot_ids = set(self.image_ids.lot_id.ids)
+        lots = self.env['stock.lot'].browse([lot_id for lot_id in lot_ids if lot_id in catalog_lot_ids])
+        status = {lot_id: ('gone', False) for lot_id in lot_ids}
+        if not lots:
+            return status
+
+        quant_by_lot = self._get_available_quants_by_lot(lots)
+        for lot_id, quant in quant_by_lot.items():
+            status[lot_id] = ('weak' if quant.reserved_quantity else 'available', quant.id)
+
+        pending = [lot_id for lot_id in lots.ids if lot_id not in quant_by_lot]
+        if pending:
+            groups = self.env['stock.quant'].sudo()._read_group([
+                ('lot_id', 'in', pending),
+                ('company_id', '=', self.company_id.id),
+                ('location_id.usage', '=', 'internal'),
+                ('quantity', '>', 0),
+            ], ['lot_id'])
+            for (lot,) in groups:
+                status[lot.id] = ('held', False)
+        return status
+
+    # =========================================================
+    # Catálogo público
+    # =========================================================
+
+    def _get_public_image_url(self, image_id, size='lightbox', version=None):
+        self.ensure_one()
+        url = "/gallery/image/{}/{}/{}".format(self.access_token, image_id, size)
+        if version:
+            url += "?v={}".format(version)
+        return url
+
+    def _get_public_catalog(self):
+        """
+        Catálogo público agrupado por categoría, desde el snapshot guardado
+        mientras la versión del inventario de sus lotes no cambie.
+
+        La versión sale de UNA consulta agregada (fechas de escritura y
+        conteos, por índice de lote); la disponibilidad completa, agrupar,
+        ordenar y armar los items solo se hace cuando la versión cambia.
+        """
+        self.ensure_one()
+
+        version = self._get_catalog_version()
+        if self.catalog_snapshot and self.catalog_snapshot_key == version:
+            catalog = self.catalog_snapshot
+        else:
+            images = self.image_ids.filtered('lot_id')
+            quant_by_lot = self._get_available_quants_by_lot(images.lot_id)
+            catalog = self._build_public_catalog(images, quant_by_lot)
+            self._store_catalog_snapshot(catalog, version)
+        # La versión viaja en los cursores de página del catálogo público.
+        return dict(catalog, version=version)
+
+    def _get_catalog_version(self):
+        """
+        Versión de todo lo que alimenta el catálogo: token, fotos, lotes,
+        productos, categorías (nombres), quants (existencia, reservas, holds)
+        y movimientos de los lotes (reservas débiles de carrito).
+
+        Cualquier alta, cambio o baja mueve alguna fecha máxima o conteo.
+        """
+        self.ensure_one()
+
+        field = self._fields['image_ids']
+        self.env.cr.execute(SQL(
+            """
+            WITH img AS (
+                SELECT i.id, i.lot_id, i.write_date
+                  FROM %(rel)s r
+                  JOIN stock_lot_image i ON i.id = r.%(image_col)s
+                 WHERE r.%(share_col)s = %(share)s
+                   AND i.lot_id IS NOT NULL
+            ), lots AS (
+                SELECT DISTINCT lot_id FROM img
+            )
+            SELECT (SELECT ROW(COUNT(*), MAX(write_date), SUM(id)) FROM img),
+                   (SELECT ROW(MAX(lot.write_date), MAX(pp.write_date),
+                               MAX(pt.write_date), MAX(pc.write_date))
+                      FROM lots
+                      JOIN stock_lot lot ON lot.id = lots.lot_id
+                      JOIN product_product pp ON pp.id = lot.product_id
+                      JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                 LEFT JOIN product_category pc ON pc.id = pt.categ_id),
+                   (SELECT ROW(COUNT(*), MAX(q.write_date), SUM(q.id))
+                      FROM stock_quant q
+                     WHERE q.lot_id IN (SELECT lot_id FROM lots)
+                       AND q.company_id = %(company)s),
+                   (SELECT ROW(COUNT(*), MAX(ml.write_date))
+                      FROM stock_move_line ml
+                     WHERE ml.lot_id IN (SELECT lot_id FROM lots))
+            """,
+            rel=SQL.identifier(field.relation),
+            image_col=SQL.identifier(field.column2),
+            share_col=SQL.identifier(field.column1),
+            share=self.id,
+            company=self.company_id.id,
+        ))
+        parts = [self.access_token] + [str(value) for value in self.env.cr.fetchone()]
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def _store_catalog_snapshot(self, catalog, version):
+        """
+        Guarda el snapshot solo si la fila del catálogo se puede tomar YA.
+
+        Dos visitas simultáneas del mismo enlace no se esperan ni chocan: la
+        que no obtiene el bloqueo (o llega tarde a una fila ya actualizada)
+        omite el guardado; su catálogo ya está calculado.
+        """
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute(SQL(
+                    "SELECT id FROM gallery_share WHERE id = %s FOR UPDATE NOWAIT",
+                    self.id,
+                ))
+                self.env.cr.execute(SQL(
+                    """
+                    UPDATE gallery_share
+                       SET catalog_snapshot = %s::jsonb, catalog_snapshot_key = %s
+                     WHERE id = %s
+                    """,
+                    json.dumps(catalog), version, self.id,
+                ))
+        except (errors.LockNotAvailable, errors.SerializationFailure):
+            return
+        self.invalidate_recordset(['catalog_snapshot', 'catalog_snapshot_key'])
+
+    def _build_public_catalog(self, images, quant_by_lot):
+        """
+        Agrupa las placas disponibles por categoría y bloque.
+
+        Devuelve un dict serializable (se guarda como JSON): las categorías
+        van como lista de pares porque jsonb no conserva el orden de llaves.
+        """
+        self.ensure_one()
+
+        # Precarga de productos y categorías en una consulta por modelo.
+        images.lot_id.product_id.categ_id.mapped('name')
+
+        # -------------------------------------------------------------
+        # 1. Recolección de items válidos (con stock real y sin holds)
+        # -------------------------------------------------------------
+        valid_items = []
+
+        for image in images:
+            lot = image.lot_id
+            quant = quant_by_lot.get(lot.id)
+            if not quant:
+                continue
+
+            alto = getattr(lot, 'x_alto', 0.0) or 0.0
+            ancho = getattr(lot, 'x_ancho', 0.0) or 0.0
+            area = alto * ancho if alto and ancho else quant.quantity
+            area = round(area, 2)
+
+            categ = lot.product_id.categ_id
+            categ_name = categ.name if categ else "General"
+
+            raw_bloque = getattr(lot, 'x_bloque', None)
+            if raw_bloque and str(raw_bloque).strip() and str(raw_bloque).strip() != '0':
+                block_name = str(raw_bloque).strip()
+            else:
+                block_name = None  # placa solitaria, sin bloque
+
+            version = rendition_stamp(image.write_date)
+            valid_items.append({
+                'image_id': image.id,
+                'quant_id': quant.id,
+                'lot_id': lot.id,
+                'lot_name': lot.name,
+                'product_id': lot.product_id.id,
+                'product_name': lot.product_id.name,
+                'categ_name': categ_name,
+                'block_name': block_name,
+                'alto': alto,
+                'ancho': ancho,
+                'area': area,
+                'dimensions': "{:.2f} x {:.2f} m".format(alto, ancho) if alto else "",
+                'url': self._get_public_image_url(image.id, 'lightbox', version),
+                'thumb_url': self._get_public_image_url(image.id, 'grid', version),
+                'write_date': str(image.write_date),
+            })
+
+        # -------------------------------------------------------------
+        # 2. Agrupar items por (categoría, bloque)
+        #    La regla aplica a nivel categoría, no producto.
+        # -------------------------------------------------------------
+        block_map = defaultdict(list)
+        loose_items = []  # placas sin bloque, van directo a individuales
+
+        for item in valid_items:
+            if item['block_name']:
+                block_map[(item['categ_name'], item['block_name'])].append(item)
+            else:
+                loose_items.append(item)
+
+        # -------------------------------------------------------------
+        # 3. Contar bloques "grandes" (>= THRESHOLD_BLOCK_SIZE) por categoría
+        # -------------------------------------------------------------
+        big_blocks_per_category = defaultdict(int)
+        for (categ_name, _block), items in block_map.items():
+            if len(items) >= THRESHOLD_BLOCK_SIZE:
+                big_blocks_per_category[categ_name] += 1
+
+        eligible_categories = {
+            cat for cat, count in big_blocks_per_category.items()
+            if count >= THRESHOLD_CATEGORY_BLOCKS
+        }
+
+        # -------------------------------------------------------------
+        # 4. Construir vista final agrupada por categoría
+        # -------------------------------------------------------------
+        final_grouped = defaultdict(list)
+        blocks_data = {}
+
+        def build_single(i):
+            return {
+                'id': i['image_id'],
+                'quant_id': i['quant_id'],
+                'lot_id': i['lot_id'],
+                'name': i['product_name'],
+                'product_name': i['product_name'],
+                'lot_name': i['lot_name'],
+                'block_name': i['block_name'] or '',
+                'dimensions': i['dimensions'],
+                'area': i['area'],
+                'url': i['url'],
+                'thumb_url': i['thumb_url'],
+                'write_date': i['write_date'],
+                'type': 'single',
+            }
+
+        # 4a. Bloques agrupables vs expandibles
+        for (categ_name, block_name), items in block_map.items():
+            first = items[0]
+
+            should_group = (
+                categ_name in eligible_categories
+                and len(items) >= THRESHOLD_BLOCK_SIZE
+            )
+
+            if should_group:
+                total_area = round(sum(i['area'] for i in items), 2)
+                safe_block = re.sub(r'[^a-zA-Z0-9]', '_', block_name)
+                block_id = "BLK_{}_{}".format(safe_block, first['image_id'])
+
+                children = [build_single(i) for i in items]
+
+                block_item = {
+                    'id': block_id,
+                    'type': 'block',
+                    'name': "Bloque {}".format(block_name),
+                    'product_name': first['product_name'],
+                    'lot_name': "{} placas".format(len(items)),
+                    'dimensions': 'Variadas',
+                    'area': total_area,
+                    'url': first['url'],
+                    'thumb_url': first['thumb_url'],
+                    'child_ids': [c['id'] for c in children],
+                    'count': len(items),
+                    'block_name': block_name,
+                }
+                final_grouped[categ_name].append(block_item)
+                blocks_data[block_id] = children
+            else:
+                # expandir a singles
+                for i in items:
+                    final_grouped[i['categ_name']].append(build_single(i))
+
+        # 4b. Items sin bloque (sueltos)
+        for i in loose_items:
+            final_grouped[i['categ_name']].append(build_single(i))
+
+        # Ordenar items dentro de cada categoría: bloques primero, luego singles por área desc
+        for categ in final_grouped:
+            final_grouped[categ].sort(key=lambda x: (
+                0 if x['type'] == 'block' else 1,
+                -float(x.get('area') or 0)
+            ))
+
+        # Ordenar categorías por cantidad de items desc
+        ordered_categories = sorted(
+            final_grouped.items(),
+            key=lambda kv: -len(kv[1])
+        )
+
+        return {
+            'categories': [[categ, items] for categ, items in ordered_categories],
+            'blocks': blocks_data,
+            'total_pieces': len(valid_items),
+            'total_area': round(sum(i['area'] for i in valid_items), 2),
+            'eligible_categories': sorted(eligible_categories),
+        }
+
     # =========================================================
     # Reserva pública
     # =========================================================
@@ -496,93 +1140,154 @@ class GalleryShare(models.Model):
 
         return price_unit
 
+    def _parse_public_cart_items(self, items):
+        """Normaliza el carrito a [(lot_id, quant_id)] sin lotes repetidos."""
+        parsed = []
+        seen_lots = set()
+        for item in items or []:
+            try:
+                lot_id = int(item.get('lot_id') or 0)
+            except (TypeError, ValueError):
+                lot_id = 0
+            try:
+                quant_id = int(item.get('quant_id') or 0)
+            except (TypeError, ValueError):
+                quant_id = 0
+            if not (lot_id or quant_id):
+                continue
+            # Evita duplicar el mismo lote si por alguna razón llegó dos veces desde el carrito.
+            if lot_id:
+                if lot_id in seen_lots:
+                    continue
+                seen_lots.add(lot_id)
+            parsed.append((lot_id, quant_id))
+        return parsed
+
+    def _resolve_public_cart_quants(self, cart):
+        """
+        Quant a reservar por cada item del carrito, en UNA consulta.
+
+        1. Prioridad: el quant exacto enviado por la galería (misma empresa,
+           interno, con existencia y del mismo lote).
+        2. Fallback: el primer quant interno con existencia del lote.
+
+        Devuelve los quants en el orden del carrito, sin lotes repetidos.
+        """
+        self.ensure_one()
+
+        Quant = self.env['stock.quant'].with_company(self.company_id).sudo()
+        quant_ids = [quant_id for _lot_id, quant_id in cart if quant_id]
+        lot_ids = [lot_id for lot_id, _quant_id in cart if lot_id]
+        if not (quant_ids or lot_ids):
+            return Quant
+
+        candidates = Quant.search_fetch([
+            '|', ('id', 'in', quant_ids), ('lot_id', 'in', lot_ids),
+            ('company_id', '=', self.company_id.id),
+            ('location_id.usage', '=', 'internal'),
+            ('quantity', '>', 0),
+        ], ['lot_id', 'product_id', 'quantity', 'reserved_quantity', 'x_tiene_hold'])
+
+        by_id = {quant.id: quant for quant in candidates}
+        first_by_lot = {}
+        for quant in candidates:
+            first_by_lot.setdefault(quant.lot_id.id, quant)
+
+        resolved = Quant
+        used_lots = set()
+        for lot_id, quant_id in cart:
+            quant = by_id.get(quant_id)
+            if quant and lot_id and quant.lot_id.id != lot_id:
+                quant = None
+            if not quant and lot_id:
+                quant = first_by_lot.get(lot_id)
+            if not quant or not quant.lot_id or quant.lot_id.id in used_lots:
+                continue
+            used_lots.add(quant.lot_id.id)
+            resolved |= quant
+        return resolved
+
+    def _lock_public_hold_quants(self, quants):
+        """
+        Bloquea las filas de los quants a reservar hasta el fin de la
+        transacción. SKIP LOCKED: si otra reserva tiene tomado un quant, no se
+        espera; ese lote se considera ya no disponible.
+
+        Si otra transacción YA confirmó un cambio sobre el quant, PostgreSQL
+        aborta con error de serialización y Odoo reintenta la petición completa
+        (con datos frescos), así que un lote nunca queda reservado dos veces.
+        """
+        if not quants:
+            return quants
+        self.env.cr.execute(SQL(
+            "SELECT id FROM stock_quant WHERE id IN %s ORDER BY id FOR UPDATE SKIP LOCKED",
+            tuple(quants.ids),
+        ))
+        locked_ids = {row[0] for row in self.env.cr.fetchall()}
+        skipped = quants.filtered(lambda q: q.id not in locked_ids)
+        if skipped:
+            self._raise_public_lots_unavailable(skipped.lot_id)
+        return quants
+
+    def _raise_public_lots_unavailable(self, lots):
+        names = ', '.join(lots.mapped('name'))
+        if len(lots) == 1:
+            raise UserError(
+                f"El lote {names} ya no está disponible. "
+                f"Fue reservado por otro cliente."
+            )
+        raise UserError(
+            f"Los lotes {names} ya no están disponibles. "
+            f"Fueron reservados por otro cliente."
+        )
+
     def create_public_hold_order(self, items):
         """
         Crea una orden de reserva basada en la selección del cliente externo.
 
+        - Resuelve y bloquea todos los quants del carrito a la vez (número
+          fijo de consultas sin importar el tamaño del carrito).
         - Agrupa los lotes por producto.
         - Devuelve liga WhatsApp del vendedor con mensaje precargado.
         """
         self.ensure_one()
 
         HoldOrder = self.env['stock.lot.hold.order'].with_company(self.company_id).sudo()
-        Quant = self.env['stock.quant'].with_company(self.company_id).sudo()
 
         usd_currency = self.env['res.currency'].sudo().search([('name', '=', 'USD')], limit=1)
         if not usd_currency:
             usd_currency = self.company_id.currency_id
 
-        grouped_lines = {}
-        processed_lot_ids = set()
-
-        for item in items:
-            raw_lot_id = item.get('lot_id')
-            raw_quant_id = item.get('quant_id')
-
-            try:
-                lot_id = int(raw_lot_id) if raw_lot_id else False
-            except Exception:
-                lot_id = False
-
-            try:
-                quant_id = int(raw_quant_id) if raw_quant_id else False
-            except Exception:
-                quant_id = False
-
-            quant = Quant.browse()
-
-            # 1) Prioridad: usar el quant exacto enviado por la galería.
-            if quant_id:
-                candidate = Quant.browse(quant_id).exists()
-
-                if candidate:
-                    same_company = candidate.company_id.id == self.company_id.id
-                    is_internal = candidate.location_id.usage == 'internal'
-                    has_stock = candidate.quantity > 0
-                    same_lot = not lot_id or candidate.lot_id.id == lot_id
-
-                    if same_company and is_internal and has_stock and same_lot:
-                        quant = candidate
-                        lot_id = candidate.lot_id.id
+        quants = self._resolve_public_cart_quants(self._parse_public_cart_items(items))
+        quants = self._lock_public_hold_quants(quants)
+        # Relectura tras el bloqueo: lo leído antes pudo cambiar.
+        quants.invalidate_recordset(['quantity', 'reserved_quantity', 'x_tiene_hold'])
+
+        reserved = quants.filtered(lambda q: q.reserved_quantity > 0)
+        if reserved:
+            # Antes de rechazar: si la reserva viene de un traslado
+            # interno de carrito/escáner abierto (reserva DÉBIL de
+            # reacomodo, no un compromiso comercial), se libera sola y
+            # se recalcula. Helper de inventory_shopping_cart; hasattr
+            # por si no está instalado. Una sola llamada para todos los lotes.
+            Picking = self.env['stock.picking'].sudo()
+            if hasattr(Picking, '_release_cart_internal_reservations'):
+                released = Picking._release_cart_internal_reservations(
+                    reserved.lot_id.ids,
+                    reason='Liberado automáticamente: el lote se vendió '
+                           'desde una galería compartida.',
+                )
+                if released:
+                    reserved.invalidate_recordset(['reserved_quantity'])
 
-            # 2) Fallback: si no hay quant válido, buscar por lote.
-            if not quant and lot_id:
-                quant = Quant.search([
-                    ('lot_id', '=', lot_id),
-                    ('company_id', '=', self.company_id.id),
-                    ('location_id.usage', '=', 'internal'),
-                    ('quantity', '>', 0),
-                ], limit=1)
-
-            if not quant or not quant.lot_id:
-                continue
+        unavailable = quants.filtered(lambda q: q.reserved_quantity > 0 or q.x_tiene_hold)
+        if unavailable:
+            self._raise_public_lots_unavailable(unavailable.lot_id)
 
-            # Evita duplicar el mismo lote si por alguna razón llegó dos veces desde el carrito.
-            if quant.lot_id.id in processed_lot_ids:
-                continue
-
-            if quant.reserved_quantity > 0:
-                # Antes de rechazar: si la reserva viene de un traslado
-                # interno de carrito/escáner abierto (reserva DÉBIL de
-                # reacomodo, no un compromiso comercial), se libera sola y
-                # se recalcula. Helper de inventory_shopping_cart; hasattr
-                # por si no está instalado.
-                Picking = self.env['stock.picking'].sudo()
-                if hasattr(Picking, '_release_cart_internal_reservations'):
-                    released = Picking._release_cart_internal_reservations(
-                        [quant.lot_id.id],
-                        reason='Liberado automáticamente: el lote se vendió '
-                               'desde una galería compartida.',
-                    )
-                    if released:
-                        quant.invalidate_recordset()
-
-            if quant.reserved_quantity > 0 or quant.x_tiene_hold:
-                raise UserError(
-                    f"El lote {quant.lot_id.name} ya no está disponible. "
-                    f"Fue reservado por otro cliente."
-                )
+        grouped_lines = {}
+        processed_lot_ids = set()
 
+        for quant in quants:
             product = quant.product_id
             if not product:
                 continue
@@ -590,12 +1295,11 @@ class GalleryShare(models.Model):
             processed_lot_ids.add(quant.lot_id.id)
 
             product_key = product.id
-            price_unit = self._get_public_hold_price(product)
-
             if product_key not in grouped_lines:
+                # Precio una sola vez por producto.
                 grouped_lines[product_key] = {
                     'product': product,
-                    'price_unit': price_unit,
+                    'price_unit': self._get_public_hold_price(product),
                     'quant_ids': [],
                     'lot_ids': [],
                     'cantidad_m2': 0.0,
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+# Una búsqueda que no terminó en este tiempo ya no la espera nadie (el worker
+# que la corría pudo reciclarse).
+JOB_TTL_HOURS = 1
+# Un trabajo pendiente más viejo que esto ya no va a terminar: su hilo vivía
+# en un worker que se recicló (limit_request, límites de memoria o tiempo) y
+# murió con él. Cubre de sobra la espera en cola más la inferencia.
+JOB_STALE_MINUTES = 10
+JOB_STALE_ERROR = 'La búsqueda se interrumpió, vuelve a intentarlo'
+
+
+class SomVisionJob(models.Model):
+    """
+    Búsqueda por foto en segundo plano.
+
+    La petición HTTP solo registra el trabajo y responde su id; un hilo del
+    pool de la base de datos reenvía la foto al servicio de visión y deja aquí
+    los resultados CRUDOS (ids de adjunto y parecido). Se enriquecen al
+    entregarlos, con el inventario del momento.
+
+    El hilo vive en el proceso que recibió la petición: si ese worker se
+    recicla, el trabajo se queda en 'pendiente'. Pasado JOB_STALE_MINUTES se
+    da por fallido (al consultarlo y en el autovacuum) para que el cliente
+    deje de esperar.
+    """
+    _name = 'som.vision.job'
+    _description = 'Búsqueda Visual en Segundo Plano'
+    _order = 'id desc'
+
+    user_id = fields.Many2one(
+        'res.users',
+        string="Usuario",
+        required=True,
+        index=True,
+        ondelete='cascade',
+        readonly=True
+    )
+
+    state = fields.Selection(
+        [
+            ('pendiente', 'Pendiente'),
+            ('listo', 'Listo'),
+            ('error', 'Error'),
+        ],
+        string="Estado",
+        default='pendiente',
+        required=True,
+        readonly=True
+    )
+
+    limite = fields.Integer(
+        string="Límite",
+        readonly=True
+    )
+
+    resultados = fields.Json(
+        string="Resultados",
+        readonly=True
+    )
+
+    error = fields.Char(
+        string="Error",
+        readonly=True
+    )
+
+    def _is_stale(self):
+        self.ensure_one()
+        limit = fields.Datetime.now() - timedelta(minutes=JOB_STALE_MINUTES)
+        return self.state == 'pendiente' and self.create_date < limit
+
+    def _fail_stale(self):
+        """Marca como fallidos los trabajos pendientes que ya no van a terminar."""
+        stale = self.filtered(lambda job: job._is_stale())
+        stale.write({'state': 'error', 'error': JOB_STALE_ERROR})
+        return stale
+
+    @api.autovacuum
+    def _gc_vision_jobs(self):
+        Job = self.sudo()
+        now = fields.Datetime.now()
+        Job.search([
+            ('state', '=', 'pendiente'),
+            ('create_date', '<', now - timedelta(minutes=JOB_STALE_MINUTES)),
+        ])._fail_stale()
+        Job.search([('create_date', '<', now - timedelta(hours=JOB_TTL_HOURS))]).unlink()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de los filtros de texto del selector, con y sin índices de trigramas.
+
+Siembra 100 000 lotes, cada uno con un quant en una ubicación interna y otro
+en una de tránsito, llena gallery.plate y mide los dos caminos del selector
+para cada filtro ilike, sin índices GIN y después con ellos:
+
+- Inventario: ``_get_selector_plate_domain`` + ``_get_selector_plate_lot_ids``
+  sobre gallery_plate (índices ``index='trigram'`` de sus columnas).
+- Tránsito: ``_get_selector_quant_domain`` + ``_get_selector_lot_ids`` sobre
+  stock_quant → stock_lot → producto (índices de
+  ``_init_selector_trigram_indexes`` en stock_lot y product_template).
+
+Imprime la mediana de cada caso. Todo corre en una transacción que se
+descarta al final: la base queda igual. Quitar los índices bloquea las tablas
+mientras dura la prueba; correrlo sobre una copia de la base, no en producción.
+
+Uso (base con el módulo instalado y pg_trgm disponible)::
+
+    odoo-bin shell -d <base> --no-http < galeria/scripts/benchmark_selector_search.py
+"""
+import statistics
+import time
+
+from odoo.tools import SQL
+
+LOTES = 100_000
+REPETICIONES = 5
+
+FILTROS = [
+    {'numero_serie': 'BENCH-0420'},
+    {'bloque': 'BLK-17'},
+    {'pedimento': '24 47'},
+    {'contenedor': 'MSCU'},
+    {'atado': 'AT-3'},
+    {'color': 'beige'},
+    {'marca': 'crema'},
+    {'product_name': 'marfil'},
+    {'categoria_name': 'mármol'},
+    {'bloque': 'BLK-17', 'color': 'gris'},
+]
+
+
+def sembrar(env):
+    cr = env.cr
+    company = env.company
+    location = env['stock.warehouse'].search(
+        [('company_id', '=', company.id)], limit=1,
+    ).lot_stock_id
+    transit = env['stock.location'].search([
+        ('usage', '=', 'transit'),
+        ('company_id', 'in', [company.id, False]),
+    ], limit=1) or env['stock.location'].create({
+        'name': 'Bench Tránsito',
+        'usage': 'transit',
+        'company_id': company.id,
+    })
+    category = env['product.category'].create({'name': 'Bench Mármol'})
+    product = env['product.product'].create({
+        'name': 'Bench Crema Marfil',
+        'is_storable': True,
+        'tracking': 'lot',
+        'categ_id': category.id,
+    })
+    if 'x_marca' in product.product_tmpl_id._fields:
+        product.product_tmpl_id.x_marca = 'Bench Crema'
+
+    colores = ['beige', 'gris', 'negro', 'blanco', 'verde', 'rojo']
+    cr.execute(SQL(
+        """
+        INSERT INTO stock_lot (name, product_id, company_id, x_bloque, x_pedimento,
+                               x_contenedor, x_atado, x_color,
+                               create_uid, create_date, write_uid, write_date)
+        SELECT 'BENCH-' || lpad(n::text, 6, '0'), %(product)s, %(company)s,
+               'BLK-' || (n %% 2000), '24 47 3817 ' || lpad((n %% 9000)::text, 7, '0'),
+               'MSCU' || lpad((n %% 5000)::text, 7, '0'), 'AT-' || (n %% 400),
+               (%(colores)s::varchar[])[1 + n %% %(n_colores)s],
+               %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+          FROM generate_series(1, %(lotes)s) n
+        """,
+        product=product.id, company=company.id, colores=colores,
+        n_colores=len(colores), uid=env.uid, lotes=LOTES,
+    ))
+    cr.execute(SQL(
+        """
+        INSERT INTO stock_quant (product_id, location_id, lot_id, company_id,
+                                 quantity, reserved_quantity, in_date,
+                                 create_uid, create_date, write_uid, write_date)
+        SELECT l.product_id, loc.id, l.id, l.company_id, 5.5, 0,
+               now() at time zone 'UTC',
+               %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+          FROM stock_lot l
+         CROSS JOIN unnest(%(locations)s::int[]) AS loc(id)
+         WHERE l.product_id = %(product)s
+        """,
+        locations=[location.id, transit.id], uid=env.uid, product=product.id,
+    ))
+    env.invalidate_all()
+    env['gallery.plate']._refresh_plates()
+    for table in ('gallery_plate', 'stock_lot', 'stock_quant'):
+        cr.execute(SQL("ANALYZE %s", SQL.identifier(table)))
+
+
+def indices_placas(env):
+    env.cr.execute(
+        """
+        SELECT indexname FROM pg_indexes
+         WHERE tablename = 'gallery_plate' AND indexdef LIKE %s
+        """,
+        ['%gin_trgm_ops%'],
+    )
+    return [row[0] for row in env.cr.fetchall()]
+
+
+def indices_modulo(env):
+    env.cr.execute(
+        "SELECT indexname FROM pg_indexes WHERE indexname LIKE %s",
+        ['%galeria_%_trgm%'],
+    )
+    return [row[0] for row in env.cr.fetchall()]
+
+
+def borrar_indices(env, nombres):
+    for name in nombres:
+        env.cr.execute(SQL("DROP INDEX %s", SQL.identifier(name)))
+
+
+def medir_inventario(env):
+    Share = env['gallery.share']
+    return medir(Share._get_selector_plate_domain, Share._get_selector_plate_lot_ids)
+
+
+def medir_transito(env):
+    Share = env['gallery.share']
+    return medir(
+        lambda filtros: Share._get_selector_quant_domain(dict(filtros, stock_mode='transit')),
+        Share._get_selector_lot_ids,
+    )
+
+
+def medir(dominio, lotes):
+    tiempos = {}
+    for filtros in FILTROS:
+        domain = dominio(filtros)
+        muestras = []
+        for _i in range(REPETICIONES):
+            inicio = time.perf_counter()
+            lot_ids = lotes(domain)
+            muestras.append(time.perf_counter() - inicio)
+        tiempos[repr(filtros)] = (statistics.median(muestras), len(lot_ids))
+    return tiempos
+
+
+def imprimir(titulo, sin_indices, con_indices):
+    print()
+    print(titulo)
+    print("%-45s %12s %12s %8s" % ("filtro", "sin (ms)", "con (ms)", "lotes"))
+    for key, (antes, lotes) in sin_indices.items():
+        despues = con_indices[key][0]
+        print("%-45s %12.1f %12.1f %8d" % (key[:45], antes * 1000, despues * 1000, lotes))
+
+
+def main(env):
+    if not env.registry.has_trigram:
+        print("pg_trgm no está disponible en esta base: no hay nada que comparar.")
+        return
+
+    with env.cr.savepoint(flush=False) as savepoint:
+        sembrar(env)
+
+        borrar_indices(env, indices_placas(env))
+        inventario_sin = medir_inventario(env)
+        # Vuelve a crear los índices declarados en los campos (index='trigram').
+        env.registry.check_indexes(env.cr, ['gallery.plate'])
+        env.cr.execute("ANALYZE gallery_plate")
+        inventario_con = medir_inventario(env)
+
+        borrar_indices(env, indices_modulo(env))
+        transito_sin = medir_transito(env)
+        env['gallery.share']._init_selector_trigram_indexes()
+        env.cr.execute("ANALYZE stock_lot")
+        env.cr.execute("ANALYZE product_template")
+        transito_con = medir_transito(env)
+
+        savepoint.rollback()
+
+    imprimir("Inventario (gallery_plate)", inventario_sin, inventario_con)
+    imprimir("Tránsito (stock_quant → stock_lot)", transito_sin, transito_con)
+
+
+main(env)  # noqa: F821 - `env` lo define odoo-bin shell
@@ -32,11 +32,16 @@ function somFormatDate(value, options) {
     return out;
 }
 
+// Sondeo de disponibilidad mientras la pestaña está visible.
+const AVAILABILITY_POLL_MS = 45000;
+
 class GalleryApp {
     constructor() {
         this.cart = [];
         this.config = {};
         this.cartKey = '';
+        this.cartLots = '';
+        this.reservationKey = '';
         this.currentView = 'main';
 
         if (document.readyState === 'loading') {
@@ -50,9 +55,13 @@ class GalleryApp {
         this.config = window.galleryRawData || {};
         this.cartKey = 'stone_gallery_cart_' + (this.config.token || 'default');
 
-        const blockCount = this.config.blocks_details ? Object.keys(this.config.blocks_details).length : 0;
-        const initialViewCount = this.config.initial_view ? Object.keys(this.config.initial_view).length : 0;
-        console.log('[Gallery] Categorías:', initialViewCount, '| Bloques agrupados:', blockCount, '| Placas totales:', this.config.total_pieces);
+        this.config.blocks_details = this.config.blocks_details || {};
+        this.loadingCategories = new Set();
+        this.unavailableLots = new Set();
+
+        const blockCount = Object.keys(this.config.blocks_details).length;
+        const pendingCount = this.config.category_cursors ? Object.keys(this.config.category_cursors).length : 0;
+        console.log('[Gallery] Bloques visibles:', blockCount, '| Categorías con más páginas:', pendingCount, '| Placas totales:', this.config.total_pieces);
 
         const savedCart = localStorage.getItem(this.cartKey);
         if (savedCart) {
@@ -62,17 +71,16 @@ class GalleryApp {
                 this.cart = [];
             }
         }
-
-        const container = document.getElementById('main-gallery-container');
-        if (container) {
-            this.mainGridHTML = container.innerHTML;
-        }
+        this.cartLots = this.getCartLots();
 
         this.bindEvents();
         this.updateCartUI();
         this.updateButtonsState();
         this.updateSelectionStates();
         this.animateOnScroll();
+        this.setupInfiniteScroll();
+        this.setupAvailabilityPolling();
+        this.validateCart();
     }
 
     bindEvents() {
@@ -224,6 +232,221 @@ class GalleryApp {
         return false;
     }
 
+    // =========================================================
+    // Carga progresiva por categoría
+    // =========================================================
+
+    setupInfiniteScroll() {
+        if (this.pageObserver) {
+            this.pageObserver.disconnect();
+        }
+
+        const sentinels = document.querySelectorAll('.category-sentinel');
+        if (!sentinels.length) return;
+
+        if (!('IntersectionObserver' in window)) {
+            // Navegadores sin IntersectionObserver: se carga todo de una vez.
+            sentinels.forEach(el => this.loadCategoryPage(el, true));
+            return;
+        }
+
+        this.pageObserver = new IntersectionObserver((entries) => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    this.loadCategoryPage(entry.target);
+                }
+            });
+        }, { rootMargin: '800px 0px' });
+
+        sentinels.forEach(el => this.pageObserver.observe(el));
+    }
+
+    async loadCategoryPage(sentinel, untilEnd = false) {
+        const category = sentinel.dataset.category;
+        if (!category || this.loadingCategories.has(category)) return;
+
+        const block = sentinel.closest('.category-block');
+        const grid = block ? block.querySelector('.bento-grid') : null;
+        if (!grid) return;
+
+        this.loadingCategories.add(category);
+
+        try {
+            let cursor = sentinel.dataset.cursor;
+            let added;
+
+            do {
+                const params = new URLSearchParams({
+                    category: category,
+                    cursor: cursor,
+                    limit: this.config.page_size || 24
+                });
+                const response = await fetch(`/gallery/api/${encodeURIComponent(this.config.token)}/page?${params}`);
+                const data = await response.json();
+                if (!data.ok) break;
+
+                Object.assign(this.config.blocks_details, data.blocks || {});
+
+                let html = '';
+                added = 0;
+                (data.items || []).forEach(item => {
+                    // Con data.restart el catálogo se recalculó y la página
+                    // vuelve a empezar: no repetir tarjetas ya pintadas.
+                    if (grid.querySelector(`.bento-item[data-id="${CSS.escape(String(item.id))}"]`)) return;
+                    html += item.type === 'block' ? this.renderBlockCardHtml(item) : this.renderCardHtml(item);
+                    added++;
+                });
+                grid.insertAdjacentHTML('beforeend', html);
+
+                cursor = data.next_cursor;
+                // Una página sin tarjetas nuevas no mueve el centinela y el
+                // observer no volvería a disparar: se pide la siguiente.
+            } while ((untilEnd || !added) && cursor !== null && cursor !== undefined);
+
+            if (cursor === null || cursor === undefined) {
+                if (this.pageObserver) this.pageObserver.unobserve(sentinel);
+                sentinel.remove();
+            } else {
+                sentinel.dataset.cursor = cursor;
+            }
+
+            this.updateButtonsState();
+            this.updateSelectionStates();
+        } catch (error) {
+            console.warn('[Gallery] No se pudo cargar la siguiente página.', error);
+        } finally {
+            this.loadingCategories.delete(category);
+        }
+    }
+
+    // =========================================================
+    // Disponibilidad en vivo
+    // =========================================================
+
+    setupAvailabilityPolling() {
+        this.availabilityVersion = this.config.availability_version || '';
+        if (!this.config.token || !this.availabilityVersion) return;
+
+        const poll = () => {
+            if (document.visibilityState === 'visible') {
+                this.pollAvailability();
+            }
+        };
+        this.availabilityTimer = setInterval(poll, AVAILABILITY_POLL_MS);
+        // Al volver a la pestaña se pregunta de inmediato.
+        document.addEventListener('visibilitychange', poll);
+    }
+
+    async pollAvailability() {
+        if (this.pollingAvailability) return;
+        this.pollingAvailability = true;
+
+        try {
+            const url = `/gallery/availability/${encodeURIComponent(this.config.token)}` +
+                `?since=${encodeURIComponent(this.availabilityVersion)}`;
+            const response = await fetch(url, { credentials: 'same-origin' });
+            if (!response.ok) return;
+
+            const data = await response.json();
+            if (!data.ok) return;
+
+            this.availabilityVersion = data.version || this.availabilityVersion;
+            this.applyAvailability(data.available || [], data.unavailable || []);
+        } catch (error) {
+            console.warn('[Gallery] No se pudo consultar la disponibilidad.', error);
+        } finally {
+            this.pollingAvailability = false;
+        }
+    }
+
+    applyAvailability(available, unavailable) {
+        if (available.length === 0 && unavailable.length === 0) return;
+
+        // Lote de nuevo disponible: puede venir con otro quant (se movió de
+        // ubicación); se actualiza en tarjetas, bloques y carrito.
+        const quantByLot = {};
+        available.forEach(([lotId, quantId]) => {
+            this.unavailableLots.delete(String(lotId));
+            quantByLot[String(lotId)] = quantId;
+        });
+        unavailable.forEach(lotId => this.unavailableLots.add(String(lotId)));
+
+        document.querySelectorAll('.bento-item[data-lot-id]').forEach(el => {
+            const quantId = quantByLot[el.dataset.lotId];
+            if (quantId) el.dataset.quantId = quantId;
+        });
+        Object.values(this.config.blocks_details || {}).forEach(children => {
+            children.forEach(child => {
+                const quantId = quantByLot[String(child.lot_id)];
+                if (quantId) child.quant_id = quantId;
+            });
+        });
+
+        let changed = false;
+        this.cart.forEach(item => {
+            const quantId = quantByLot[String(item.lot_id)];
+            if (quantId && String(item.quant_id) !== String(quantId)) {
+                item.quant_id = quantId;
+                changed = true;
+            }
+        });
+
+        const before = this.cart.length;
+        this.cart = this.cart.filter(item => !this.unavailableLots.has(String(item.lot_id)));
+        const removed = before - this.cart.length;
+
+        if (removed || changed) {
+            this.saveCart();
+            this.updateCartUI();
+        }
+        if (removed) {
+            this.showToast(
+                removed === 1
+                    ? 'Una placa de tu carrito ya no está disponible'
+                    : `${removed} placas de tu carrito ya no están disponibles`,
+                'warning'
+            );
+        }
+
+        this.updateButtonsState();
+        this.updateSelectionStates();
+    }
+
+    async validateCart() {
+        // Carrito guardado de una visita anterior: se depura antes de que el
+        // cliente intente reservar placas que ya se vendieron.
+        if (!this.config.token || this.cart.length === 0) return;
+
+        try {
+            const result = await this.jsonRpc('/gallery/cart/validate', {
+                token: this.config.token,
+                items: this.cart.map(item => ({ lot_id: item.lot_id })),
+            });
+            if (!result.result || !result.result.success) return;
+
+            const available = [];
+            const unavailable = [];
+            result.result.items.forEach(item => {
+                if (item.status === 'available' || item.status === 'weak') {
+                    available.push([item.lot_id, item.quant_id]);
+                } else {
+                    unavailable.push(item.lot_id);
+                }
+            });
+            this.applyAvailability(available, unavailable);
+        } catch (error) {
+            console.warn('[Gallery] No se pudo validar el carrito.', error);
+        }
+    }
+
+    isLotUnavailable(lotId) {
+        return this.unavailableLots.has(String(lotId));
+    }
+
+    availableBlockChildren(details) {
+        return (details || []).filter(child => !this.isLotUnavailable(child.lot_id));
+    }
+
     // =========================================================
     // Vistas
     // =========================================================
@@ -244,6 +467,15 @@ class GalleryApp {
             return;
         }
 
+        // Se guarda la retícula tal como va (con las páginas ya cargadas)
+        // para restaurarla al volver.
+        if (this.currentView === 'main') {
+            this.mainGridHTML = container.innerHTML;
+        }
+        if (this.pageObserver) {
+            this.pageObserver.disconnect();
+        }
+
         let html = `
             <div class="category-block">
                 <h2 class="category-title">
@@ -292,10 +524,73 @@ class GalleryApp {
         this.currentView = 'main';
         this.updateButtonsState();
         this.updateSelectionStates();
+        this.setupInfiniteScroll();
 
         window.scrollTo({ top: 0, behavior: 'smooth' });
     }
 
+    renderBlockCardHtml(img) {
+        const areaVal = parseFloat(img.area || 0);
+
+        const safeId = this.escapeHtml(img.id);
+        const safeName = this.escapeHtml(img.product_name || img.name);
+        const safeBlock = this.escapeHtml(img.block_name || img.id);
+        const safeLotName = this.escapeHtml(img.lot_name);
+        const safeDims = this.escapeHtml(img.dimensions);
+        const safeArea = this.escapeHtml(img.area);
+        const safeUrl = this.escapeHtml(img.url);
+        const safeThumb = this.escapeHtml(img.thumb_url || img.url);
+        const safeCount = this.escapeHtml(img.count);
+
+        return `
+            <div class="bento-item is-block"
+                 data-id="${safeId}"
+                 data-type="block"
+                 data-name="${safeName}"
+                 data-lot="${safeBlock}"
+                 data-dims="${safeDims}"
+                 data-area="${safeArea}"
+                 data-url="${safeUrl}"
+                 data-thumb="${safeThumb}">
+
+                <div class="bento-card">
+                    <div class="img-container">
+                        <img src="${safeThumb}" loading="lazy" alt="${safeLotName}"/>
+                        <div class="selection-indicator">
+                            <i class="fa fa-check"></i>
+                        </div>
+
+                        <span class="block-badge">
+                            <i class="fa fa-layer-group"></i>
+                            <span>${safeCount} placas</span>
+                        </span>
+
+                        <div class="card-actions">
+                            <button class="btn-expand open-block-btn" type="button" title="Ver contenido del bloque">
+                                <i class="fa fa-folder-open"></i>
+                            </button>
+                        </div>
+                    </div>
+
+                    <div class="card-footer">
+                        <div class="info-text">
+                            <span class="product-name">${safeName}</span>
+                            <div class="meta">
+                                <span class="lot">${safeLotName}</span>
+                            </div>
+                            <span class="area-badge">${areaVal.toFixed(2)} m²</span>
+                        </div>
+
+                        <button class="btn-add-cart" type="button" aria-label="Apartar">
+                            <i class="fa fa-check"></i>
+                            <span class="sr-only">Apartar</span>
+                        </button>
+                    </div>
+                </div>
+            </div>
+        `;
+    }
+
     renderCardHtml(img) {
         const areaVal = (typeof img.area === 'number')
             ? img.area.toFixed(2)
@@ -309,6 +604,7 @@ class GalleryApp {
         const safeDims = this.escapeHtml(img.dimensions);
         const safeArea = this.escapeHtml(img.area);
         const safeUrl = this.escapeHtml(img.url);
+        const safeThumb = this.escapeHtml(img.thumb_url || img.url);
 
         return `
             <div class="bento-item"
@@ -320,11 +616,12 @@ class GalleryApp {
                  data-lot="${safeLotName}"
                  data-dims="${safeDims}"
                  data-area="${safeArea}"
-                 data-url="${safeUrl}">
+                 data-url="${safeUrl}"
+                 data-thumb="${safeThumb}">
 
                 <div class="bento-card">
                     <div class="img-container">
-                        <img src="${safeUrl}" loading="lazy" alt="${safeLotName}"/>
+                        <img src="${safeThumb}" loading="lazy" alt="${safeLotName}"/>
                         <div class="selection-indicator">
                             <i class="fa fa-check"></i>
                         </div>
@@ -372,8 +669,15 @@ class GalleryApp {
         const type = itemEl.dataset.type;
         const id = itemEl.dataset.id;
 
+        if (itemEl.classList.contains('is-unavailable')) {
+            this.showToast('Esta placa ya no está disponible', 'warning');
+            return;
+        }
+
         if (type === 'block') {
-            const details = this.config.blocks_details ? this.config.blocks_details[id] : [];
+            const details = this.availableBlockChildren(
+                this.config.blocks_details ? this.config.blocks_details[id] : []
+            );
 
             if (!details || details.length === 0) {
                 this.showToast('No se pudo cargar el bloque', 'error');
@@ -400,7 +704,8 @@ class GalleryApp {
                             lot_name: child.lot_name,
                             dims: child.dimensions,
                             area: parseFloat(child.area || 0),
-                            url: child.url
+                            url: child.url,
+                            thumb_url: child.thumb_url || child.url
                         });
                         added++;
                     }
@@ -423,7 +728,8 @@ class GalleryApp {
                     lot_name: itemEl.dataset.lot,
                     dims: itemEl.dataset.dims,
                     area: parseFloat(itemEl.dataset.area || 0),
-                    url: itemEl.dataset.url
+                    url: itemEl.dataset.url,
+                    thumb_url: itemEl.dataset.thumb || itemEl.dataset.url
                 });
 
                 this.saveCart();
@@ -452,6 +758,15 @@ class GalleryApp {
     }
 
     saveCart() {
+        // Otras placas en el carrito: el siguiente envío es un intento de
+        // reserva nuevo. Guardar el mismo conjunto de lotes (quant o datos
+        // refrescados por la disponibilidad) conserva la llave, así que un
+        // reintento sigue recibiendo la misma reserva.
+        const cartLots = this.getCartLots();
+        if (cartLots !== this.cartLots) {
+            this.cartLots = cartLots;
+            this.resetReservationKey();
+        }
         try {
             localStorage.setItem(this.cartKey, JSON.stringify(this.cart));
         } catch (error) {
@@ -459,6 +774,75 @@ class GalleryApp {
         }
     }
 
+    // Conjunto de lotes del carrito, sin importar el orden.
+    getCartLots() {
+        return [...new Set(this.cart.map(item => String(item.lot_id)))].sort().join(',');
+    }
+
+    // Llave de idempotencia del intento de reserva actual. Se guarda junto al
+    // carrito para que un reintento (o una recarga tras una respuesta lenta)
+    // reciba la misma reserva en lugar de crear otra.
+    getReservationKey() {
+        const storageKey = this.cartKey + '_request';
+        let key = '';
+        try {
+            key = localStorage.getItem(storageKey) || '';
+        } catch (error) {
+            key = this.reservationKey || '';
+        }
+        if (!key) {
+            key = (window.crypto && window.crypto.randomUUID)
+                ? window.crypto.randomUUID()
+                : Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+            try {
+                localStorage.setItem(storageKey, key);
+            } catch (error) {
+                // Sin localStorage la llave vive solo en memoria.
+            }
+        }
+        this.reservationKey = key;
+        return key;
+    }
+
+    resetReservationKey() {
+        this.reservationKey = '';
+        try {
+            localStorage.removeItem(this.cartKey + '_request');
+        } catch (error) {
+            // Sin localStorage no hay nada que limpiar.
+        }
+    }
+
+    async jsonRpc(url, params) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                jsonrpc: '2.0',
+                method: 'call',
+                params: params,
+                id: Math.floor(Math.random() * 1000)
+            })
+        });
+        return response.json();
+    }
+
+    async postReservation(attempt = 0) {
+        const result = await this.jsonRpc('/gallery/confirm_reservation', {
+            token: this.config.token,
+            items: this.cart,
+            request_key: this.getReservationKey(),
+        });
+
+        // El mismo intento sigue en proceso en otra petición: se vuelve a
+        // preguntar y se recibe la misma reserva.
+        if (result.result && result.result.pending && attempt < 5) {
+            await new Promise(resolve => setTimeout(resolve, 1500));
+            return this.postReservation(attempt + 1);
+        }
+        return result;
+    }
+
     updateButtonsState() {
         const counter = document.getElementById('cart-count');
         const cartToggleBtn = document.getElementById('cart-toggle');
@@ -531,20 +915,25 @@ class GalleryApp {
             const type = el.dataset.type;
             const id = el.dataset.id;
             let isSelected = false;
+            let isUnavailable = false;
 
             if (type === 'block') {
-                const details = this.config.blocks_details ? this.config.blocks_details[id] : [];
+                const allDetails = this.config.blocks_details ? this.config.blocks_details[id] : [];
+                const details = this.availableBlockChildren(allDetails);
 
-                if (details && details.length > 0) {
+                if (details.length > 0) {
                     const allIds = details.map(d => String(d.id));
                     const countInCart = this.cart.filter(c => allIds.includes(String(c.id))).length;
                     isSelected = countInCart === details.length;
                 }
+                isUnavailable = !!(allDetails && allDetails.length > 0 && details.length === 0);
             } else {
                 isSelected = this.cart.some(i => String(i.id) === String(id));
+                isUnavailable = this.isLotUnavailable(el.dataset.lotId);
             }
 
             el.classList.toggle('is-selected', isSelected);
+            el.classList.toggle('is-unavailable', isUnavailable);
         });
     }
 
@@ -568,7 +957,8 @@ class GalleryApp {
             this.cart.forEach(item => {
                 totalArea += item.area || 0;
 
-                const safeUrl = this.escapeHtml(item.url);
+                // Miniatura 'grid': la foto del visor pesa demasiado para el carrito.
+                const safeUrl = this.escapeHtml(item.thumb_url || item.url);
                 const safeName = this.escapeHtml(item.name);
                 const safeLotName = this.escapeHtml(item.lot_name);
                 const safeDims = this.escapeHtml(item.dims);
@@ -854,21 +1244,7 @@ class GalleryApp {
                 throw new Error('Token no encontrado.');
             }
 
-            const response = await fetch('/gallery/confirm_reservation', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    jsonrpc: '2.0',
-                    method: 'call',
-                    params: {
-                        token: this.config.token,
-                        items: this.cart
-                    },
-                    id: Math.floor(Math.random() * 1000)
-                })
-            });
-
-            const result = await response.json();
+            const result = await this.postReservation();
 
             if (result.result && result.result.success) {
                 const whatsappUrl = result.result.whatsapp_url || '';
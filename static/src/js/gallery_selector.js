@@ -1,12 +1,31 @@
 /** @odoo-module **/
 
 import { registry } from "@web/core/registry";
-import { Component, useState, onWillStart, useRef, xml } from "@odoo/owl";
+import { Component, useState, onWillStart, onMounted, onWillUnmount, useRef, xml } from "@odoo/owl";
 import { useService } from "@web/core/utils/hooks";
 import { Dialog } from "@web/core/dialog/dialog";
 import { useDebounced } from "@web/core/utils/timing";
 import { SearchBar } from "@inventory_visual_enhanced/components/search_bar/search_bar";
 
+// Grilla virtual del selector: solo se montan las filas visibles y las
+// páginas se piden al servidor a medida que entran en pantalla.
+const PAGE_SIZE = 60;
+const ROW_HEIGHT = 282;        // alto fijo de tarjeta (270) + separación (12), ver scss
+const CARD_MIN_WIDTH = 190;
+const BUFFER_ROWS = 3;
+const MAX_CACHED_PAGES = 12;
+
+// Facetas con conteo que se muestran sobre la grilla: faceta del servidor ->
+// filtro del selector que aplica al elegir un valor.
+const FACETS = [
+    { name: 'color', filter: 'color', label: 'Color' },
+    { name: 'grosor', filter: 'grosor', label: 'Grosor' },
+    { name: 'almacen', filter: 'almacen_id', label: 'Almacén' },
+    { name: 'tipo', filter: 'tipo', label: 'Tipo' },
+    { name: 'marca', filter: 'marca', label: 'Marca' },
+];
+const FACET_MAX_VALUES = 6;
+
 // --- Componente Modal ---
 class CreateLinkDialog extends Component {
     setup() {
@@ -17,7 +36,12 @@ class CreateLinkDialog extends Component {
         this.state = useState({ 
             partner_id: false, 
             query: "",          
-            suggestions: []     
+            suggestions: [],
+            // Modo varios clientes: misma selección para cada contacto.
+            multi: false,
+            partners: [],
+            sendEmail: false,
+            results: null,
         });
 
         this.debouncedSearch = useDebounced(async (term) => {
@@ -51,12 +75,45 @@ class CreateLinkDialog extends Component {
     }
 
     selectPartner(partner) {
+        if (this.state.multi) {
+            if (!this.state.partners.some(p => p.id === partner.id)) {
+                this.state.partners.push(partner);
+            }
+            this.state.query = "";
+            this.state.suggestions = [];
+            return;
+        }
         this.state.partner_id = partner.id;
         this.state.query = partner.name; 
         this.state.suggestions = [];     
     }
 
+    removePartner(partnerId) {
+        this.state.partners = this.state.partners.filter(p => p.id !== partnerId);
+    }
+
+    toggleMulti() {
+        this.state.multi = !this.state.multi;
+        this.state.partner_id = false;
+        this.state.partners = [];
+        this.state.query = "";
+        this.state.suggestions = [];
+    }
+
+    isPartnerSelected(partner) {
+        return this.state.multi
+            ? this.state.partners.some(p => p.id === partner.id)
+            : this.state.partner_id === partner.id;
+    }
+
+    get canConfirm() {
+        return this.state.multi ? this.state.partners.length > 0 : !!this.state.partner_id;
+    }
+
     async confirm() {
+        if (this.state.multi) {
+            return this.confirmMulti();
+        }
         if (!this.state.partner_id) {
             this.notification.add("Debes buscar y seleccionar un contacto válido", { type: "danger" });
             return;
@@ -78,11 +135,76 @@ class CreateLinkDialog extends Component {
             this.notification.add(error.message, { type: "danger" });
         }
     }
+
+    async confirmMulti() {
+        if (!this.state.partners.length) {
+            this.notification.add("Agrega al menos un contacto", { type: "danger" });
+            return;
+        }
+        try {
+            this.state.results = await this.orm.call("gallery.share", "create_from_selector_multi", [
+                this.state.partners.map(p => p.id),
+                this.props.selectedImages
+            ], { send_email: this.state.sendEmail });
+            this.notification.add(`${this.state.results.length} catálogos generados`, { type: "success" });
+        } catch (error) {
+            this.notification.add(error.message, { type: "danger" });
+        }
+    }
+
+    async copyUrl(url) {
+        try {
+            await navigator.clipboard.writeText(url);
+            this.notification.add("Liga copiada", { type: "success" });
+        } catch {
+            this.notification.add("No se pudo copiar la liga", { type: "warning" });
+        }
+    }
+
+    openResults() {
+        const ids = this.state.results.map(r => r.id);
+        this.props.close();
+        this.action.doAction({
+            type: 'ir.actions.act_window',
+            name: 'Catálogos generados',
+            res_model: 'gallery.share',
+            domain: [['id', 'in', ids]],
+            views: [[false, 'list'], [false, 'form']],
+            target: 'current',
+        });
+    }
 }
 
 CreateLinkDialog.template = xml`
     <Dialog title="props.title">
-        <div class="p-4">
+        <div t-if="state.results" class="p-4">
+            <h5 class="mb-3"><t t-esc="state.results.length"/> catálogos generados</h5>
+            <ul class="list-group">
+                <t t-foreach="state.results" t-as="r" t-key="r.id">
+                    <li class="list-group-item">
+                        <div class="d-flex justify-content-between align-items-center mb-1">
+                            <span class="fw-bold"><t t-esc="r.partner_name"/></span>
+                            <small class="text-muted">
+                                <t t-esc="r.name"/>
+                                <span t-if="r.emailed" class="ms-2 text-success"><i class="fa fa-envelope"/> en cola</span>
+                            </small>
+                        </div>
+                        <div class="input-group input-group-sm">
+                            <input type="text" class="form-control" readonly="1" t-att-value="r.url"/>
+                            <button type="button" class="btn btn-outline-secondary" title="Copiar liga"
+                                    t-on-click="() => this.copyUrl(r.url)">
+                                <i class="fa fa-copy"/>
+                            </button>
+                            <a t-if="r.whatsapp_url" class="btn btn-success" t-att-href="r.whatsapp_url"
+                               target="_blank" title="Enviar por WhatsApp">
+                                <i class="fa fa-whatsapp"/>
+                            </a>
+                        </div>
+                    </li>
+                </t>
+            </ul>
+        </div>
+        <div t-else="" class="p-4">
             <div class="mb-4 text-center">
                 <div class="bg-light rounded-circle d-inline-flex p-3 mb-2 text-primary">
                     <i class="fa fa-share-alt fa-2x"/>
@@ -90,6 +212,12 @@ CreateLinkDialog.template = xml`
                 <h5>Compartir <strong class="text-primary"><t t-esc="props.selectedImages.length"/></strong> imágenes</h5>
             </div>
 
+            <div class="form-check form-switch mb-3">
+                <input class="form-check-input" type="checkbox" id="gallery_link_multi"
+                       t-att-checked="state.multi" t-on-change="toggleMulti"/>
+                <label class="form-check-label" for="gallery_link_multi">Varios clientes (un catálogo para cada uno)</label>
+            </div>
+
             <div class="mb-3 position-relative">
                 <label class="form-label fw-bold">Buscar Cliente</label>
                 <div class="input-group">
@@ -112,19 +240,45 @@ CreateLinkDialog.template = xml`
                                 <div class="fw-bold"><t t-esc="p.name"/></div>
                                 <small t-if="p.email" class="text-muted"><t t-esc="p.email"/></small>
                             </div>
-                            <i class="fa fa-check text-primary" t-if="state.partner_id === p.id"/>
+                            <i class="fa fa-check text-primary" t-if="isPartnerSelected(p)"/>
                         </button>
                     </t>
                 </div>
             </div>
             
-            <div t-if="state.partner_id" class="alert alert-success py-2 d-flex align-items-center">
+            <div t-if="!state.multi and state.partner_id" class="alert alert-success py-2 d-flex align-items-center">
                 <i class="fa fa-check-circle me-2"/> Cliente seleccionado
             </div>
+
+            <t t-if="state.multi">
+                <div t-if="state.partners.length" class="d-flex flex-wrap gap-2 mb-3">
+                    <t t-foreach="state.partners" t-as="p" t-key="p.id">
+                        <span class="badge rounded-pill text-bg-primary d-inline-flex align-items-center">
+                            <t t-esc="p.name"/>
+                            <i class="fa fa-times ms-2" role="button" title="Quitar"
+                               t-on-click="() => this.removePartner(p.id)"/>
+                        </span>
+                    </t>
+                </div>
+                <div class="form-check">
+                    <input class="form-check-input" type="checkbox" id="gallery_link_email"
+                           t-model="state.sendEmail"/>
+                    <label class="form-check-label" for="gallery_link_email">Enviar también por correo (a los contactos con email)</label>
+                </div>
+            </t>
         </div>
         <t t-set-slot="footer">
-            <button class="btn btn-light" t-on-click="props.close">Cancelar</button>
-            <button class="btn btn-primary px-4" t-on-click="confirm" t-att-disabled="!state.partner_id">Generar Link</button>
+            <t t-if="state.results">
+                <button class="btn btn-light" t-on-click="props.close">Cerrar</button>
+                <button class="btn btn-primary px-4" t-on-click="openResults">Ver catálogos</button>
+            </t>
+            <t t-else="">
+                <button class="btn btn-light" t-on-click="props.close">Cancelar</button>
+                <button class="btn btn-primary px-4" t-on-click="confirm" t-att-disabled="!canConfirm">
+                    <t t-if="state.multi">Generar <t t-esc="state.partners.length"/> Links</t>
+                    <t t-else="">Generar Link</t>
+                </button>
+            </t>
         </t>
     </Dialog>
 `;
@@ -139,11 +293,15 @@ export class GallerySelector extends Component {
         this.scrollRef = useRef("scrollContainer");
         
         this.state = useState({
-            // Paginación
-            allItems: [],       
-            visibleItems: [],   
-            pageSize: 40,
-            currentPage: 1,
+            // Paginación en servidor + ventana visible
+            total: 0,
+            visibleItems: [],
+            columns: 4,
+            padTop: 0,
+            padBottom: 0,
+
+            // Placas por valor de faceta en el resultado actual
+            facetCounts: {},
 
             // Filtros activos
             filters: {
@@ -194,12 +352,29 @@ export class GallerySelector extends Component {
         this.searchTimeout = null;
         this.debouncedLoad = useDebounced(() => this.loadImages(), 500);
 
+        // Páginas ya traídas (fuera del estado reactivo: no se renderizan).
+        this.pages = new Map();
+        this.pendingPages = new Set();
+        // Páginas en caché que llegaron cortas y ya se volvieron a pedir.
+        this.refetchedPages = new Set();
+        this.searchSeq = 0;
+        this.scrollFrame = null;
+
+        onMounted(() => {
+            this.resizeObserver = new ResizeObserver(() => this.updateWindow());
+            this.resizeObserver.observe(this.scrollRef.el);
+        });
+        onWillUnmount(() => {
+            this.resizeObserver?.disconnect();
+            if (this.scrollFrame) cancelAnimationFrame(this.scrollFrame);
+        });
+
         onWillStart(async () => {
             try {
                 this.state.currentCompanyId = await this.orm.call("gallery.share", "get_current_company", []);
             } catch (e) { console.error("Error company:", e); }
 
-            await this.loadImages();
+            await Promise.all([this.loadFilterOptions(), this.loadImages()]);
         });
     }
 
@@ -227,63 +402,16 @@ export class GallerySelector extends Component {
 
     async loadFilterOptions() {
         try {
-            // Almacenes
-            this.state.almacenes = await this.orm.searchRead(
-                "stock.warehouse", [], ["id", "name"], { order: "name" }
-            );
-
-            // Tipos (selection field de stock.quant)
-            try {
-                const fields = await this.orm.call("stock.lot", "fields_get", [["x_tipo"]], { attributes: ["selection"] });
-                this.state.tipos = fields.x_tipo ? fields.x_tipo.selection : [];
-            } catch(e) { this.state.tipos = []; }
-
-            // Categorías de producto
-            this.state.categorias = await this.orm.searchRead(
-                "product.category", [], ["id", "name"], { order: "name", limit: 100 }
-            );
-
-            // Grupos (bloques únicos)
-            try {
-                const lots = await this.orm.searchRead(
-                    "stock.lot", [["x_bloque", "!=", false]], ["x_bloque"], { limit: 500 }
-                );
-                const uniq = [...new Set(lots.map(l => l.x_bloque).filter(Boolean))].sort();
-                this.state.grupos = uniq.map(b => [b, b]);
-            } catch(e) { this.state.grupos = []; }
-
-            // Grosores únicos
-            try {
-                const grosores = await this.orm.call(
-                    "stock.quant", "read_group",
-                    [[["x_grosor", "!=", false], ["quantity", ">", 0]]],
-                    { groupby: ["x_grosor"], fields: ["x_grosor"] }
-                );
-                const grosorSet = new Set();
-                grosores.forEach(g => { if (g.x_grosor) grosorSet.add(g.x_grosor); });
-                this.state.grosores = Array.from(grosorSet).sort((a, b) => a - b);
-            } catch(e) { this.state.grosores = []; }
-
-            // Marcas (x_marca en product.template)
-            try {
-                const marcas = await this.orm.call(
-                    "product.template", "read_group",
-                    [[["x_marca", "!=", false]]],
-                    { groupby: ["x_marca"], fields: ["x_marca"] }
-                );
-                this.state.marcas = marcas.map(m => m.x_marca).filter(Boolean).sort();
-            } catch(e) { this.state.marcas = []; }
-
-            // Colores únicos (x_color en stock.quant)
-            try {
-                const colores = await this.orm.call(
-                    "stock.quant", "read_group",
-                    [[["x_color", "!=", false], ["quantity", ">", 0]]],
-                    { groupby: ["x_color"], fields: ["x_color"] }
-                );
-                this.state.colores = colores.map(c => c.x_color).filter(Boolean).sort();
-            } catch(e) { this.state.colores = []; }
-
+            // Una sola llamada: el servidor calcula todas las opciones sobre
+            // los quants con existencia y las guarda en caché por empresa.
+            const facets = await this.orm.call("gallery.share", "get_selector_facets", []);
+            this.state.almacenes = facets.almacenes;
+            this.state.tipos = facets.tipos;
+            this.state.categorias = facets.categorias;
+            this.state.grupos = facets.grupos;
+            this.state.grosores = facets.grosores;
+            this.state.marcas = facets.marcas;
+            this.state.colores = facets.colores;
         } catch(e) {
             console.error("Error cargando opciones de filtros:", e);
         }
@@ -357,280 +485,152 @@ export class GallerySelector extends Component {
 
     async loadImages() {
         this.state.loading = true;
-        this.state.currentPage = 1; 
-        
+        this.searchSeq++;
+        this.pages.clear();
+        this.pendingPages.clear();
+        this.refetchedPages.clear();
+
         try {
-            const f = this.state.filters;
-
-            // --- Dominio base para stock.quant ---
-            // Modo Inventario (mismo selector que el inventario visual):
-            // 'stock' = existencias internas libres; 'transit' = material en
-            // tránsito SIN asignación (lo asignado a un pedido no se ofrece).
-            const inTransit = f.stock_mode === 'transit';
-            const quantDomain = inTransit
-                ? [
-                    ['location_id.usage', '=', 'transit'],
-                    ['quantity', '>', 0],
-                    ['x_tiene_hold', '=', false],
-                ]
-                : [
-                    ['location_id.usage', '=', 'internal'],
-                    ['quantity', '>', 0],
-                    ['reserved_quantity', '=', 0],
-                    ['x_tiene_hold', '=', false],
-                ];
-
-            if (inTransit) {
-                try {
-                    const reservedLines = await this.orm.searchRead(
-                        "stock.transit.line",
-                        [['allocation_status', '=', 'reserved'], ['lot_id', '!=', false]],
-                        ["lot_id"], { limit: 5000 }
-                    );
-                    const reservedLotIds = [...new Set(reservedLines.map(l => l.lot_id[0]))];
-                    if (reservedLotIds.length) {
-                        quantDomain.push(['lot_id', 'not in', reservedLotIds]);
-                    }
-                } catch (e) { /* módulo de tránsito ausente: sin exclusión extra */ }
-            }
+            // Una sola llamada por página: el servidor arma el dominio,
+            // aplica el mínimo por bloque y los precios en SQL y devuelve los
+            // items ya agrupados (bloques primero, luego placas sueltas).
+            await this.fetchPage(0);
+        } catch (e) {
+            console.error("Error loading images:", e);
+        } finally {
+            this.state.loading = false;
+        }
+        if (this.scrollRef.el) {
+            this.scrollRef.el.scrollTop = 0;
+        }
+        this.updateWindow();
+    }
 
-            if (this.state.currentCompanyId) {
-                quantDomain.unshift(['company_id', '=', this.state.currentCompanyId]);
+    /**
+     * Trae una página de items. Devuelve true solo si guardó datos nuevos,
+     * para que quien espera no vuelva a pintar la ventana en vano.
+     */
+    async fetchPage(page, force = false) {
+        if ((!force && this.pages.has(page)) || this.pendingPages.has(page)) return false;
+        const seq = this.searchSeq;
+        this.pendingPages.add(page);
+        try {
+            const result = await this.orm.call("gallery.share", "search_selector_items", [], {
+                filters: this.state.filters,
+                active_block: this.state.activeBlock || false,
+                offset: page * PAGE_SIZE,
+                limit: PAGE_SIZE,
+            });
+            // Respuesta de una búsqueda anterior: se descarta.
+            if (seq !== this.searchSeq) return false;
+            this.pages.set(page, result.items);
+            if (!force) this.refetchedPages.delete(page);
+            this.state.total = result.total;
+            if (page === 0) {
+                this.state.facetCounts = result.facets || {};
             }
+            return true;
+        } finally {
+            if (seq === this.searchSeq) this.pendingPages.delete(page);
+        }
+    }
 
-            // Filtro de almacén / ubicación
-            if (f.ubicacion_id) {
-                quantDomain.push(['location_id', '=', parseInt(f.ubicacion_id)]);
-            } else if (f.almacen_id) {
-                quantDomain.push(['location_id.warehouse_id', '=', parseInt(f.almacen_id)]);
+    updateWindow() {
+        const el = this.scrollRef.el;
+        if (!el) return;
+
+        const total = this.state.total;
+        const columns = Math.max(2, Math.floor(el.clientWidth / CARD_MIN_WIDTH));
+        const totalRows = Math.ceil(total / columns);
+        const firstRow = Math.max(0, Math.floor(el.scrollTop / ROW_HEIGHT) - BUFFER_ROWS);
+        const lastRow = Math.min(totalRows, Math.ceil((el.scrollTop + el.clientHeight) / ROW_HEIGHT) + BUFFER_ROWS);
+        const start = firstRow * columns;
+        const end = Math.min(total, lastRow * columns);
+
+        const items = [];
+        const missing = new Set();
+        const short = new Set();
+        for (let index = start; index < end; index++) {
+            const page = Math.floor(index / PAGE_SIZE);
+            const pageItems = this.pages.get(page);
+            if (pageItems && pageItems[index - page * PAGE_SIZE]) {
+                items.push(pageItems[index - page * PAGE_SIZE]);
+                continue;
             }
-
-            // Modo bloque activo
-            if (this.state.activeBlock) {
-                quantDomain.push(['lot_id.x_bloque', '=', this.state.activeBlock]);
-            } else {
-                // Búsqueda por nombre de producto
-                if (f.product_name && f.product_name.trim()) {
-                    quantDomain.push(['product_id.name', 'ilike', f.product_name.trim()]);
-                }
-                // Tipo
-                if (f.tipo) {
-                    quantDomain.push(['lot_id.x_tipo', '=', f.tipo]);
-                }
-                // Categoría por nombre
-                if (f.categoria_name && f.categoria_name.trim()) {
-                    quantDomain.push(['product_id.categ_id.name', 'ilike', f.categoria_name.trim()]);
-                }
-                // Grupo / tono (selection del quant, igual que el inventario visual)
-                if (f.grupo && String(f.grupo).trim()) {
-                    quantDomain.push(['x_grupo', '=', f.grupo]);
-                }
-                // Acabado
-                if (f.acabado && String(f.acabado).trim()) {
-                    quantDomain.push(['x_acabado', '=', f.acabado]);
-                }
-                // Grosor/Espesor
-                if (f.grosor) {
-                    quantDomain.push(['lot_id.x_grosor', '=', parseFloat(f.grosor)]);
-                }
-                // Alto mínimo
-                if (f.alto_min) {
-                    try { quantDomain.push(['lot_id.x_alto', '>=', parseFloat(f.alto_min)]); } catch(e) {}
-                }
-                // Ancho mínimo
-                if (f.ancho_min) {
-                    try { quantDomain.push(['lot_id.x_ancho', '>=', parseFloat(f.ancho_min)]); } catch(e) {}
-                }
-                // Lote / Número de serie (múltiples separados por coma)
-                if (f.numero_serie && f.numero_serie.trim()) {
-                    const parts = f.numero_serie.split(',').map(s => s.trim()).filter(Boolean);
-                    if (parts.length === 1) {
-                        quantDomain.push(['lot_id.name', 'ilike', parts[0]]);
-                    } else if (parts.length > 1) {
-                        quantDomain.push(['lot_id.name', 'in', parts]);
-                    }
-                }
-                // Bloque explícito
-                if (f.bloque && f.bloque.trim()) {
-                    quantDomain.push(['lot_id.x_bloque', 'ilike', f.bloque.trim()]);
-                }
-                // Pedimento
-                if (f.pedimento && f.pedimento.trim()) {
-                    quantDomain.push(['lot_id.x_pedimento', 'ilike', f.pedimento.trim()]);
-                }
-                // Contenedor
-                if (f.contenedor && f.contenedor.trim()) {
-                    quantDomain.push(['lot_id.x_contenedor', 'ilike', f.contenedor.trim()]);
-                }
-                // Atado
-                if (f.atado && f.atado.trim()) {
-                    quantDomain.push(['lot_id.x_atado', 'ilike', f.atado.trim()]);
-                }
-                // Color
-                if (f.color && f.color.trim()) {
-                    quantDomain.push(['lot_id.x_color', 'ilike', f.color.trim()]);
-                }
-                // Marca
-                if (f.marca && f.marca.trim()) {
-                    quantDomain.push(['product_id.product_tmpl_id.x_marca', 'ilike', f.marca.trim()]);
-                }
+            items.push({ type: 'placeholder', key: index });
+            if (!pageItems) {
+                missing.add(page);
+            } else if (!this.refetchedPages.has(page)) {
+                // Página en caché más corta que el total actual (el
+                // resultado creció después de traerla): se pide UNA vez más.
+                short.add(page);
             }
+        }
 
-            const validQuants = await this.orm.searchRead(
-                "stock.quant", quantDomain, ["lot_id", "product_id", "quantity"], { limit: 2000 }
-            );
-
-            let validLotIds = validQuants.map(q => q.lot_id[0]);
-
-            // Cant. mínima por bloque (m²): igual que el inventario visual,
-            // se suma la existencia del bloque completo y se descartan los
-            // bloques por debajo del mínimo.
-            if (f.cantidad_min_bloque && parseFloat(f.cantidad_min_bloque) > 0) {
-                try {
-                    const minQty = parseFloat(f.cantidad_min_bloque);
-                    const lotsBloque = await this.orm.read(
-                        "stock.lot", validLotIds, ["id", "x_bloque"]
-                    );
-                    const bloqueByLot = {};
-                    lotsBloque.forEach(l => { bloqueByLot[l.id] = l.x_bloque || ''; });
-                    const sumByBloque = {};
-                    validQuants.forEach(q => {
-                        const b = bloqueByLot[q.lot_id[0]] || '';
-                        sumByBloque[b] = (sumByBloque[b] || 0) + (q.quantity || 0);
-                    });
-                    validLotIds = validLotIds.filter(
-                        id => (sumByBloque[bloqueByLot[id] || ''] || 0) >= minQty
-                    );
-                } catch (e) { console.error("Error filtro cant. mín. bloque:", e); }
-            }
+        this.state.columns = columns;
+        this.state.padTop = firstRow * ROW_HEIGHT;
+        this.state.padBottom = Math.max(0, totalRows - lastRow) * ROW_HEIGHT;
+        this.state.visibleItems = items;
 
-            // Filtro de precios: MISMA semántica que el inventario visual —
-            // divisa (USD por defecto) + rango; el producto pasa si CUALQUIERA
-            // de sus niveles de precio cae dentro del rango.
-            if (f.price_min || f.price_max) {
-                const cur = (f.price_currency || 'USD').toLowerCase();
-                const priceFields = [1, 2, 3].map(n => `x_price_${cur}_${n}`);
-                const productIds = [...new Set(validQuants.map(q => q.product_id[0]))];
-                const minV = f.price_min ? parseFloat(f.price_min) : null;
-                const maxV = f.price_max ? parseFloat(f.price_max) : null;
-
-                try {
-                    const prods = await this.orm.read(
-                        "product.product", productIds, ["id"].concat(priceFields)
-                    );
-                    const matchedProductIds = new Set();
-                    prods.forEach(pr => {
-                        const ok = priceFields.some(fld => {
-                            const v = pr[fld];
-                            if (!v && v !== 0) return false;
-                            if (minV !== null && v < minV) return false;
-                            if (maxV !== null && v > maxV) return false;
-                            return true;
-                        });
-                        if (ok) matchedProductIds.add(pr.id);
-                    });
-                    const filteredQuants = validQuants.filter(q => matchedProductIds.has(q.product_id[0]));
-                    validLotIds = filteredQuants.map(q => q.lot_id[0]);
-                } catch(e) {
-                    console.error("Error en filtro de precios:", e);
-                }
-            }
+        this.evictPages(Math.floor(start / PAGE_SIZE));
+        const requests = [...missing].map(page => this.fetchPage(page));
+        for (const page of short) {
+            this.refetchedPages.add(page);
+            requests.push(this.fetchPage(page, true));
+        }
+        for (const request of requests) {
+            request
+                .then((fetched) => fetched && this.updateWindow())
+                .catch((e) => console.error("Error loading images:", e));
+        }
+    }
 
-            if (validLotIds.length === 0) {
-                this.state.allItems = [];
-                this.state.visibleItems = [];
-                this.state.loading = false;
-                return;
+    evictPages(currentPage) {
+        // Solo se guardan las páginas cercanas a la ventana visible.
+        if (this.pages.size <= MAX_CACHED_PAGES) return;
+        for (const page of [...this.pages.keys()]) {
+            if (Math.abs(page - currentPage) > MAX_CACHED_PAGES / 2) {
+                this.pages.delete(page);
             }
+        }
+    }
 
-            const lotsData = await this.orm.read(
-                "stock.lot", validLotIds, ["id", "name", "x_bloque", "x_alto", "x_ancho", "product_id"]
-            );
-            
-            const lotMap = {};
-            lotsData.forEach(l => {
-                lotMap[l.id] = {
-                    name: l.name,
-                    block: l.x_bloque || false,
-                    h: l.x_alto || 0,
-                    w: l.x_ancho || 0,
-                    product: l.product_id ? l.product_id[1] : 'Producto'
-                };
-            });
-
-            const images = await this.orm.searchRead(
-                "stock.lot.image", [['lot_id', 'in', validLotIds]], 
-                ["id", "name", "lot_id", "write_date"], { order: "id desc" }
-            );
-
-            const grouped = {};
-            const singleItems = [];
-            const forceSingles = !!this.state.activeBlock;
-
-            images.forEach(img => {
-                const lData = lotMap[img.lot_id[0]];
-                if (!lData) return;
-
-                const imgObj = {
-                    type: 'single',
-                    key: img.id,
-                    id: img.id, 
-                    lot_name: lData.name,
-                    name: lData.name, 
-                    dims: `${lData.h.toFixed(2)} x ${lData.w.toFixed(2)}`,
-                    area: (lData.h * lData.w),
-                    unique: img.write_date,
-                    product_name: lData.product,
-                    cover_id: img.id,
-                    cover_unique: img.write_date
-                };
-
-                if (lData.block && !forceSingles) {
-                    if (!grouped[lData.block]) {
-                        grouped[lData.block] = {
-                            type: 'block',
-                            key: lData.block,
-                            name: `Bloque ${lData.block}`,
-                            product_name: lData.product,
-                            ids: [],      
-                            items: [],    
-                            total_area: 0,
-                            cover_id: img.id, 
-                            cover_unique: img.write_date
-                        };
-                    }
-                    grouped[lData.block].ids.push(img.id);
-                    grouped[lData.block].items.push(imgObj);
-                    grouped[lData.block].total_area += imgObj.area;
-                } else {
-                    singleItems.push(imgObj);
-                }
-            });
+    onScroll() {
+        if (this.scrollFrame) return;
+        this.scrollFrame = requestAnimationFrame(() => {
+            this.scrollFrame = null;
+            this.updateWindow();
+        });
+    }
 
-            const blocks = Object.values(grouped);
-            this.state.allItems = [...blocks, ...singleItems];
-            this.loadMoreImages();
+    // =========================================================
+    //  FACETAS
+    // =========================================================
 
-        } catch (e) {
-            console.error("Error loading images:", e);
-        } finally {
-            this.state.loading = false;
-        }
+    get facetChips() {
+        // El servidor cuenta cada faceta sin su propio filtro: la faceta
+        // elegida sigue mostrando sus otros valores. Sin filtro propio solo
+        // se muestran facetas con más de un valor (con uno no hay qué elegir).
+        const counts = this.state.facetCounts || {};
+        return FACETS
+            .filter(facet => (counts[facet.name] || []).length > 1 || this.isFacetActive(facet))
+            .map(facet => ({
+                ...facet,
+                values: (counts[facet.name] || []).slice(0, FACET_MAX_VALUES),
+            }));
     }
 
-    loadMoreImages() {
-        const end = this.state.currentPage * this.state.pageSize;
-        this.state.visibleItems = this.state.allItems.slice(0, end);
+    isFacetActive(facet, value) {
+        const current = this.state.filters[facet.filter];
+        if (value === undefined) return !!current;
+        return current !== '' && current === String(value);
     }
 
-    onScroll(ev) {
-        const el = ev.target;
-        if (el.scrollTop + el.clientHeight >= el.scrollHeight - 200) {
-            if (this.state.visibleItems.length < this.state.allItems.length) {
-                this.state.currentPage++;
-                this.loadMoreImages();
-            }
-        }
+    applyFacet(facet, value) {
+        // Volver a pulsar el valor elegido quita el filtro.
+        this.state.filters[facet.filter] = this.isFacetActive(facet, value) ? '' : String(value);
+        this.state.activeBlock = null;
+        this.loadImages();
     }
 
     // =========================================================
@@ -673,14 +673,13 @@ export class GallerySelector extends Component {
         return item.ids.length > 0 && item.ids.every(id => this.state.selectedIds.has(id));
     }
 
-    selectAll() {
-        this.state.allItems.forEach(item => {
-            if (item.type === 'block') {
-                item.ids.forEach(id => this.state.selectedIds.add(id));
-            } else {
-                this.state.selectedIds.add(item.id);
-            }
+    async selectAll() {
+        // Solo hay páginas sueltas en memoria: el servidor da todos los ids.
+        const ids = await this.orm.call("gallery.share", "search_selector_image_ids", [], {
+            filters: this.state.filters,
+            active_block: this.state.activeBlock || false,
         });
+        ids.forEach(id => this.state.selectedIds.add(id));
     }
 
     clearSelection() {
@@ -6,6 +6,13 @@ import { useService } from "@web/core/utils/hooks";
 // Odoo 19: rpc dejó de ser un servicio de useService y se importa directo.
 import { rpc } from "@web/core/network/rpc";
 
+// Resultados por página ("Ver más" pide la siguiente).
+const PAGINA = 24;
+
+// Sondeo de las búsquedas por foto asíncronas.
+const INTERVALO_SONDEO_MS = 700;
+const ESPERA_MAXIMA_MS = 90000;
+
 /**
  * Buscador visual de materiales.
  *
@@ -27,6 +34,9 @@ export class VisionSearch extends Component {
     setup() {
         this.notification = useService("notification");
         this.fileInput = useRef("fileInput");
+        this.busquedaActual = 0;
+        // Pide una página (offset) de la búsqueda actual sin repetirla.
+        this.paginador = null;
 
         this.state = useState({
             consulta: "",
@@ -38,6 +48,11 @@ export class VisionSearch extends Component {
             visor: null,
             indexadas: null,
             error: null,
+            // Las placas vendidas o apartadas se ocultan salvo que se pidan.
+            soloDisponibles: true,
+            // Cursor de la página siguiente de la búsqueda actual (null = fin).
+            siguiente: null,
+            cargandoMas: false,
         });
 
         // Escape cierra el visor: es lo que espera cualquiera con una foto
@@ -66,8 +81,10 @@ export class VisionSearch extends Component {
         this.state.cargando = true;
         this.state.error = null;
         this.state.miniatura = null;
+        this.busquedaActual++;
+        this.paginador = (offset) => rpc("/som_vision/buscar_texto", { q, limite: PAGINA, offset });
         try {
-            const res = await rpc("/som_vision/buscar_texto", { q, limite: 24 });
+            const res = await this.paginador(0);
             this._recibir(res);
         } finally {
             this.state.cargando = false;
@@ -125,9 +142,15 @@ export class VisionSearch extends Component {
         // Miniatura local para que se vea CON QUÉ se está buscando.
         this.state.miniatura = URL.createObjectURL(archivo);
 
+        // Cada búsqueda nueva deja sin efecto el sondeo de la anterior.
+        const busqueda = ++this.busquedaActual;
+
         const datos = new FormData();
         datos.append("foto", archivo);
-        datos.append("limite", "24");
+        datos.append("limite", String(PAGINA));
+        // Asíncrona: Odoo responde de inmediato con un id de trabajo y la
+        // búsqueda corre en segundo plano; aquí se pregunta por el resultado.
+        datos.append("asincrono", "1");
         // Odoo protege con CSRF todas las rutas POST de tipo http. Sin este
         // token la peticion se rechaza con 400 antes de llegar al controlador.
         // Se manda el token en vez de desactivar la proteccion con csrf=False.
@@ -137,25 +160,116 @@ export class VisionSearch extends Component {
                 method: "POST",
                 body: datos,
             });
-            this._recibir(await resp.json());
+            let res = await resp.json();
+            this.paginador = null;
+            if (res.ok && res.trabajo) {
+                const trabajo = res.trabajo;
+                res = await this._esperarTrabajo(trabajo, busqueda);
+                // Las páginas siguientes salen del trabajo: la foto no se sube otra vez.
+                this.paginador = (offset) => rpc(`/som_vision/resultado/${trabajo}`, { offset });
+            }
+            if (busqueda !== this.busquedaActual) {
+                return;
+            }
+            this._recibir(res);
         } catch {
             this.state.error = "No se pudo procesar la imagen";
         } finally {
-            this.state.cargando = false;
-            this.state.buscado = true;
+            if (busqueda === this.busquedaActual) {
+                this.state.cargando = false;
+                this.state.buscado = true;
+            }
+        }
+    }
+
+    async _esperarTrabajo(trabajo, busqueda) {
+        const limite = Date.now() + ESPERA_MAXIMA_MS;
+        while (Date.now() < limite && busqueda === this.busquedaActual) {
+            await new Promise((resolve) => setTimeout(resolve, INTERVALO_SONDEO_MS));
+            const res = await rpc(`/som_vision/resultado/${trabajo}`, {});
+            if (!res.ok || res.estado === "listo") {
+                return res;
+            }
         }
+        return { ok: false, error: "La búsqueda tardó demasiado; intenta de nuevo" };
     }
 
     _recibir(res) {
         if (res && res.ok) {
             this.state.resultados = res.resultados || [];
+            this.state.siguiente = this.paginador ? (res.siguiente ?? null) : null;
             this.state.error = null;
         } else {
             this.state.resultados = [];
+            this.state.siguiente = null;
             this.state.error = (res && res.error) || "La búsqueda falló";
         }
     }
 
+    async verMas() {
+        if (this.state.siguiente === null || this.state.cargandoMas || !this.paginador) {
+            return;
+        }
+        const busqueda = this.busquedaActual;
+        this.state.cargandoMas = true;
+        try {
+            const res = await this.paginador(this.state.siguiente);
+            if (busqueda !== this.busquedaActual) {
+                return;
+            }
+            if (res && res.ok) {
+                this.state.resultados = [...this.state.resultados, ...(res.resultados || [])];
+                this.state.siguiente = res.siguiente ?? null;
+            } else {
+                this.notification.add((res && res.error) || "No se pudieron cargar más resultados", {
+                    type: "warning",
+                });
+            }
+        } finally {
+            this.state.cargandoMas = false;
+        }
+    }
+
+    async buscarSimilares(resultado) {
+        // "Más como esta": el servicio reutiliza el embedding que ya tiene
+        // guardado para esa foto; no se sube nada.
+        this.cerrarVisor();
+        this.busquedaActual++;
+        const busqueda = this.busquedaActual;
+        this.state.cargando = true;
+        this.state.error = null;
+        this.state.consulta = "";
+        this.state.miniatura = resultado.imagen_url;
+        const attachment_id = resultado.attachment_id;
+        this.paginador = (offset) => rpc("/som_vision/similares", { attachment_id, limite: PAGINA, offset });
+        try {
+            const res = await this.paginador(0);
+            if (busqueda === this.busquedaActual) {
+                this._recibir(res);
+            }
+        } finally {
+            if (busqueda === this.busquedaActual) {
+                this.state.cargando = false;
+                this.state.buscado = true;
+            }
+        }
+    }
+
+    get visibles() {
+        if (!this.state.soloDisponibles) {
+            return this.state.resultados;
+        }
+        return this.state.resultados.filter((r) => r.disponible);
+    }
+
+    get ocultos() {
+        return this.state.resultados.length - this.visibles.length;
+    }
+
+    alternarDisponibles() {
+        this.state.soloDisponibles = !this.state.soloDisponibles;
+    }
+
     abrirVisor(resultado) {
         this.state.visor = resultado;
     }